@@ -2,108 +2,302 @@
 RPG / Roguelike terminal 
 """
 
-import os, sys, time, random, re, ctypes, math
-from collections import namedtuple, deque
+import os, sys, io, time, random, re, ctypes, math, shutil, threading
+from collections import namedtuple, deque, OrderedDict
 
 if os.name == 'nt':
     import msvcrt
 
-def _getch_timeout(timeout_sec=0.18):
-    """Lit une touche avec timeout; retourne None si aucune touche."""
-    timeout_sec = max(0.0, float(timeout_sec))
-    if os.name == 'nt':
-        end = time.time() + timeout_sec
-        while time.time() < end:
-            if msvcrt.kbhit():
-                return msvcrt.getwch()
-            time.sleep(0.01)
-        return None
-    import select
-    r, _, _ = select.select([sys.stdin], [], [], timeout_sec)
-    if r:
-        return _getch_blocking()
-    return None
+# Session clavier active (voir TerminalSession); None = lecture touche par touche.
+TERMINAL_SESSION = None
 
-def _getch_blocking():
-    """Lit une touche immédiatement (Windows: msvcrt, Unix: termios)."""
-    if os.name == 'nt':
-        ch = msvcrt.getwch()  # unicode (gère z,q,s,d)
-        return ch
-    else:
-        import tty, termios
-        fd = sys.stdin.fileno()
-        old = termios.tcgetattr(fd)
-        try:
-            tty.setraw(fd)
-            ch = sys.stdin.read(1)
-        finally:
-            termios.tcsetattr(fd, termios.TCSADRAIN, old)
-        return ch
+class TerminalSession:
+    """
+    Session clavier persistante pour toute la partie.
+    Le terminal passe une seule fois en mode caractère (sans écho ni tampon de ligne)
+    au lieu de basculer à chaque touche; les touches sont lues par blocs et mises en
+    tampon, puis servies à read_command. Le mode ligne n'est rétabli que le temps
+    d'une saisie (read_line) et le terminal est restauré en sortie, même sur crash.
+    """
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdin
+        self.fd = None
+        self._termios = None
+        self._saved = None
+        self._raw = False
+        self._decoder = None
+        self._pending = deque()
+        self._prev_session = None
+        self.interrupts = 0  # événements bloquants vus (voir interrupt_type_ahead)
+
+    def __enter__(self):
+        global TERMINAL_SESSION
+        self._prev_session = TERMINAL_SESSION
+        TERMINAL_SESSION = self
+        if os.name != 'nt':
+            try:
+                fd = self.stream.fileno()
+                if os.isatty(fd):
+                    import termios, codecs
+                    self._termios = termios
+                    self._saved = termios.tcgetattr(fd)
+                    self._decoder = codecs.getincrementaldecoder(getattr(self.stream, 'encoding', None) or 'utf-8')(errors='replace')
+                    self.fd = fd
+            except (AttributeError, ValueError, OSError):
+                self.fd = None
+        self._enter_raw()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global TERMINAL_SESSION
+        self._leave_raw()
+        TERMINAL_SESSION = self._prev_session
+        return False
 
-def read_command(repeat_last_dir):
+    def _enter_raw(self):
+        if self.fd is None or self._raw:
+            return
+        import tty
+        tty.setcbreak(self.fd, self._termios.TCSANOW)
+        self._raw = True
+
+    def _leave_raw(self):
+        if self.fd is None or not self._raw:
+            return
+        self._termios.tcsetattr(self.fd, self._termios.TCSADRAIN, self._saved)
+        self._raw = False
+
+    def _fill(self, timeout):
+        """Ajoute au tampon tout ce qui est disponible (attend au plus `timeout`, None = bloquant)."""
+        if os.name == 'nt':
+            end = None if timeout is None else time.time() + timeout
+            while not msvcrt.kbhit():
+                if end is not None and time.time() >= end:
+                    return
+                time.sleep(0.01)
+            while msvcrt.kbhit():
+                self._pending.append(msvcrt.getwch())
+            return
+        if self.fd is None:
+            # Flux non interactif (pipe, fichier): tout ce qui reste est déjà disponible.
+            ch = self.stream.read(1)
+            if not ch:
+                if timeout is None:
+                    raise EOFError
+                return
+            self._pending.append(ch)
+            return
+        import select
+        self._enter_raw()
+        r, _, _ = select.select([self.fd], [], [], timeout)
+        if not r:
+            return
+        data = os.read(self.fd, 1024)
+        if not data:
+            raise EOFError
+        self._pending.extend(self._decoder.decode(data))
+
+    def read_key(self, timeout=None):
+        """Retourne la prochaine touche, ou None si `timeout` (secondes) expire."""
+        if not self._pending:
+            self._fill(None if timeout is None else max(0.0, float(timeout)))
+        return self._pending.popleft() if self._pending else None
+
+    def unread(self, chars):
+        """Remet des touches en tête du tampon (lecture anticipée de l'automate)."""
+        self._pending.extendleft(reversed(chars))
+
+    def flush(self):
+        """Oublie les touches tapées d'avance (tampon local + tampon du terminal)."""
+        self._pending.clear()
+        if self.fd is not None:
+            self._termios.tcflush(self.fd, self._termios.TCIFLUSH)
+
+    def interrupt(self):
+        self.flush()
+        self.interrupts += 1
+
+    def read_line(self, prompt=''):
+        # Saisie ligne: on repasse en mode normal; le mode caractère revient à la prochaine touche.
+        self._pending.clear()
+        self._leave_raw()
+        return input(prompt)
+
+def read_line(prompt=''):
+    """input() compatible avec la session clavier active."""
+    if TERMINAL_SESSION is not None:
+        return TERMINAL_SESSION.read_line(prompt)
+    return input(prompt)
+
+# Séquences d'échappement Unix (flèches, pavé numérique) → ('dir', touche) ou ('spell', slot).
+# Les touches de navigation du pavé reprennent le mapping Windows (Fin=1, PgDn=3, Début=7, PgUp=9, Ins=0).
+ESC_SEQ_KEYS = {
+    'A': ('dir', 'z'), 'B': ('dir', 's'), 'C': ('dir', 'd'), 'D': ('dir', 'q'),
+    'H': ('spell', 7), '1~': ('spell', 7), '7~': ('spell', 7),
+    'F': ('spell', 1), '4~': ('spell', 1), '8~': ('spell', 1),
+    '5~': ('spell', 9), '6~': ('spell', 3), '2~': ('spell', 10),
+}
+WIN_ARROW_KEYS = {'H': 'z', 'P': 's', 'K': 'q', 'M': 'd'}  # ↑ ↓ ← →
+WIN_NUMPAD_SPELL_KEYS = {'O': 1, 'Q': 3, 'G': 7, 'I': 9, 'R': 10}
+# Préfixes des codes de touches spéciales Windows; ailleurs '\xe0' est 'à' (sort rapide 10).
+WIN_SCAN_PREFIXES = ('\xe0', '\x00') if os.name == 'nt' else ()
+
+class InputTokenizer:
     """
-    Retourne toujours un 2-tuple :
-      ('move', (n, (dx,dy)))  ou  ('action', 'e'|'i'|'j'|'c'|'m'|'x'|None)
-      ou ('quick_spell', index_1_based)
+    Automate qui découpe le flux de touches tamponné en commandes de jeu.
+    - chiffre seul → raccourci sort; chiffres + direction → déplacement multiple;
+      la décision se prend sur les touches déjà reçues; sans MOVE_COUNT_PREFIX seulement,
+      elle attend DIGIT_COUNT_TIMEOUT si rien ne suit encore;
+    - MOVE_COUNT_PREFIX + chiffres + direction → déplacement sans aucune ambiguïté;
+    - séquences multi-octets (flèches, pavé numérique Unix/Windows) décodées en une commande.
     """
-    digits = ''
-    buffered_ch = None
-    while True:
-        if buffered_ch is not None:
-            ch = buffered_ch.lower()
-            buffered_ch = None
-        else:
-            ch = _getch_blocking().lower()
+    ESC_TIMEOUT = 0.03  # suite d'une séquence ESC (arrive normalement dans le même bloc)
+
+    class _NeedMore(Exception):
+        pass
+
+    def __init__(self, session):
+        self.session = session
+        self._polling = False
+        self._taken = []
+
+    def _read(self, timeout=None):
+        if not self._polling:
+            return self.session.read_key(timeout)
+        # Mode sondage: uniquement ce qui est déjà arrivé, jamais d'attente.
+        k = self.session.read_key(0)
+        if k is None:
+            raise self._NeedMore()
+        self._taken.append(k)
+        return k
+
+    def _unread(self, ch):
+        self.session.unread(ch)
+        if self._polling:
+            del self._taken[-len(ch):]
+
+    def poll_move(self, repeat_last_dir):
+        """Déplacement complet déjà présent dans le tampon, sinon None (tampon intact)."""
+        self._polling = True
+        self._taken = []
+        try:
+            cmd = self.next_command(repeat_last_dir)
+        except self._NeedMore:
+            cmd = None
+        finally:
+            self._polling = False
+        if cmd is None or cmd[0] != 'move':
+            self.session.unread(self._taken)
+            return None
+        return cmd
+
+    def _special(self, ch):
+        """Décode une séquence spéciale commençant par ch; None = à ignorer."""
+        if ch in WIN_SCAN_PREFIXES:
+            k = self._read()
+            if k in WIN_ARROW_KEYS:
+                return ('dir', WIN_ARROW_KEYS[k])
+            if k in WIN_NUMPAD_SPELL_KEYS:
+                return ('spell', WIN_NUMPAD_SPELL_KEYS[k])
+            return None
+        intro = self._read(self.ESC_TIMEOUT)
+        if intro not in ('[', 'O'):
+            # ESC seul (ou Alt+touche): on ignore l'ESC, la touche suivante reste à lire.
+            if intro is not None:
+                self._unread(intro)
+            return None
+        seq = ''
+        while len(seq) < 8:
+            k = self._read(self.ESC_TIMEOUT)
+            if k is None:
+                return None
+            seq += k
+            if k.isalpha() or k == '~':
+                break
+        if intro == 'O' and len(seq) == 1 and 'p' <= seq <= 'y':
+            # Pavé numérique en mode application: ESC O p..y = 0..9
+            return ('digit', chr(ord('0') + ord(seq) - ord('p')))
+        key = (seq[:-1].split(';')[0] + '~') if seq.endswith('~') else seq[-1:]
+        return ESC_SEQ_KEYS.get(key)
 
-        # ignorer retours chariot/escapes
-        if ch in ('\r', '\n', '\x1b'):
-            digits = ''
-            continue
+    def next_command(self, repeat_last_dir):
+        digits = ''
+        counting = False  # préfixe de nombre saisi: les chiffres ne sont plus des sorts
+        while True:
+            raw = self._read()
+            if raw == '\x1b' or raw in WIN_SCAN_PREFIXES:
+                tok = self._special(raw)
+                if tok is None:
+                    digits = ''; counting = False
+                    continue
+                kind, val = tok
+                if kind == 'spell':
+                    return ('quick_spell', val)
+                ch = val  # 'dir' → touche de direction, 'digit' → chiffre
+            else:
+                ch = raw.lower()
 
-        # Raccourcis sorts (AZERTY rangée 1 sans passer par le grimoire)
-        if ch in QUICK_SPELL_KEYS:
-            return ('quick_spell', QUICK_SPELL_KEYS[ch])
-
-        if ch.isdigit():
-            # 1..0 en raccourcis sort (si touche seule), sinon nombre+direction pour déplacement.
-            if not digits:
-                peek = _getch_timeout(0.18)
-                if peek is None:
-                    slot = 10 if ch == '0' else int(ch)
-                    return ('quick_spell', slot)
-                digits = ch
-                buffered_ch = peek
+            # ignorer retours chariot
+            if ch in ('\r', '\n'):
+                digits = ''; counting = False
+                continue
+
+            # Raccourcis sorts (AZERTY rangée 1 sans passer par le grimoire)
+            if ch in QUICK_SPELL_KEYS:
+                return ('quick_spell', QUICK_SPELL_KEYS[ch])
+
+            if MOVE_COUNT_PREFIX and ch == MOVE_COUNT_PREFIX:
+                digits = ''; counting = True
                 continue
-            digits += ch
-            continue
 
-        if ch == '.':
-            if repeat_last_dir != (0,0):
-                n = int(digits) if digits else 1
-                return ('move', (n, repeat_last_dir))
-            return ('action', None)
+            if ch.isdigit():
+                # 1..0 en raccourcis sort (si touche seule), sinon nombre+direction pour déplacement.
+                if not digits and not counting:
+                    peek = self._read(0 if MOVE_COUNT_PREFIX else DIGIT_COUNT_TIMEOUT)
+                    if peek is None:
+                        return ('quick_spell', 10 if ch == '0' else int(ch))
+                    self._unread(peek)
+                digits += ch
+                continue
 
-        if ch in DIR_KEYS:  # z/w, q/a, s, d
             n = int(digits) if digits else 1
-            return ('move', (n, DIR_KEYS[ch]))
-
-        if ch in ('e','i','j','c','m','x'):
-            return ('action', ch)
-
-        # (optionnel) support flèches/pavé numérique sous Windows
-        if os.name == 'nt' and ch in ('\xe0', '\x00'):
-            k = _getch_blocking()
-            arrow_map = {'H':'z','P':'s','K':'q','M':'d'}  # ↑ ↓ ← →
-            numpad_spell_map = {'O':1, 'Q':3, 'G':7, 'I':9, 'R':10}
-            if k in arrow_map:
-                n = int(digits) if digits else 1
-                return ('move', (n, DIR_KEYS[arrow_map[k]]))
-            if k in numpad_spell_map:
-                return ('quick_spell', numpad_spell_map[k])
-            continue
+            if ch == '.':
+                if repeat_last_dir != (0,0):
+                    return ('move', (n, repeat_last_dir))
+                return ('action', None)
 
-        # touche non gérée → on ignore et on ré-écoute
-        digits = ''
+            if ch in DIR_KEYS:  # z/w, q/a, s, d
+                return ('move', (n, DIR_KEYS[ch]))
+
+            if ch in ('e','i','j','c','m','o','g','x'):
+                return ('action', ch)
+
+            # touche non gérée → on ignore et on ré-écoute
+            digits = ''; counting = False
+
+def poll_queued_move(repeat_last_dir, session=None):
+    """Déplacement déjà tapé d'avance (sans attendre), sinon None."""
+    session = session or TERMINAL_SESSION
+    if session is None:
+        return None
+    return InputTokenizer(session).poll_move(repeat_last_dir)
+
+def interrupt_type_ahead():
+    """Événement bloquant (combat, popup): les touches tapées d'avance sont abandonnées."""
+    if TERMINAL_SESSION is not None:
+        TERMINAL_SESSION.interrupt()
+
+def read_command(repeat_last_dir, session=None):
+    """
+    Retourne toujours un 2-tuple :
+      ('move', (n, (dx,dy)))  ou  ('action', 'e'|'i'|'j'|'c'|'m'|'o'|'g'|'x'|None)
+      ou ('quick_spell', index_1_based)
+    """
+    session = session or TERMINAL_SESSION
+    if session is None:
+        with TerminalSession() as tmp:
+            return InputTokenizer(tmp).next_command(repeat_last_dir)
+    return InputTokenizer(session).next_command(repeat_last_dir)
         
 # ========================== COULEURS ANSI ==========================
 class Ansi:
@@ -115,6 +309,7 @@ class Ansi:
 
 SUPPORTS_ANSI = True
 SHOW_SIDE_SPRITE = True
+SHOW_FRAME_STATS = False  # ligne de debug sous le HUD: octets/durée d'envoi des frames
 MAP_FRAME_ACTIVE = False
 
 # Truecolor (RGB) — pour de vrais pastels si le terminal le supporte
@@ -206,10 +401,184 @@ def c(text, *styles):
         return str(text)
     return ''.join(styles) + str(text) + Ansi.RESET
 
+# ========================== ASSEMBLAGE DES FRAMES ==========================
+class FrameWriter:
+    """
+    Assemble une frame complète (effacement, boîtes, lignes) puis l'envoie en un seul
+    write + flush, pour qu'un pty lent ne la reçoive pas en morceaux.
+    Les frames s'imbriquent (draw_box dans open_inventory): seule la plus externe écrit.
+    """
+    HISTORY = 120
+
+    def __init__(self, stream=None):
+        self.stream = stream  # None = sys.stdout au moment de l'envoi
+        self._parts = None
+        self._depth = 0
+        self.history = deque(maxlen=self.HISTORY)  # (octets, secondes d'envoi) par frame
+        self.frames = 0
+        self.total_bytes = 0
+
+    def __enter__(self):
+        if self._depth == 0:
+            self._parts = []
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            data = ''.join(self._parts)
+            self._parts = None
+            if data:
+                self._send(data, record=True)
+        return False
+
+    def write(self, s: str):
+        if self._parts is not None:
+            self._parts.append(s)
+        else:
+            self._send(s)
+
+    def _send(self, data: str, record=False):
+        out = self.stream or sys.stdout
+        t0 = time.perf_counter()
+        out.write(data)
+        out.flush()
+        if record:
+            n = len(data.encode('utf-8'))
+            self.history.append((n, time.perf_counter() - t0))
+            self.frames += 1
+            self.total_bytes += n
+
+    def stats(self) -> dict:
+        """Octets et durée d'envoi (ms) des dernières frames."""
+        if not self.history:
+            return {'frames': self.frames, 'last_bytes': 0, 'avg_bytes': 0, 'last_flush_ms': 0.0, 'max_flush_ms': 0.0}
+        sizes = [n for n, _ in self.history]
+        times = [t for _, t in self.history]
+        return {
+            'frames': self.frames,
+            'last_bytes': sizes[-1],
+            'avg_bytes': sum(sizes) // len(sizes),
+            'last_flush_ms': times[-1] * 1000.0,
+            'max_flush_ms': max(times) * 1000.0,
+        }
+
+FRAME = FrameWriter()
+
+def emit(text='', end='\n'):
+    # print() vers la frame en cours (ou directement si aucune frame n'est ouverte).
+    FRAME.write(str(text) + end)
+
 # ========================== WIDGET D'ENCADREMENT ==========================
 _ansi_re = re.compile(r"\x1b\[[0-9;]*m")
+_ansi_split_re = re.compile(r"(\x1b\[[0-9;]*m)")
 
-def visible_len(s: str) -> int:
+class StyledText:
+    """
+    Texte stylé en segments (style, texte) : largeur visible connue sans rescanner l'ANSI,
+    padding et retour à la ligne sans regex. str() redonne la chaîne ANSI.
+    """
+    __slots__ = ('spans', 'width')
+
+    def __init__(self, spans=()):
+        self.spans = [(st, tx) for st, tx in spans if tx]
+        self.width = sum(len(tx) for _, tx in self.spans)
+
+    @classmethod
+    def of(cls, text, *styles):
+        # Équivalent de c() côté segments.
+        return cls([(''.join(styles) if SUPPORTS_ANSI else '', str(text))])
+
+    @classmethod
+    def from_ansi(cls, s):
+        if isinstance(s, StyledText):
+            return s
+        # split() alterne texte / séquence SGR: un seul passage regex, en C.
+        parts = _ansi_split_re.split(str(s))
+        spans = [('', parts[0])] if parts[0] else []
+        style = ''
+        for k in range(1, len(parts), 2):
+            seq = parts[k]
+            style = '' if seq in ('\x1b[0m', '\x1b[m') else style + seq
+            tx = parts[k + 1]
+            if tx:
+                spans.append((style, tx))
+        out = cls.__new__(cls)
+        out.spans = spans
+        out.width = sum(len(tx) for _, tx in spans)
+        return out
+
+    @classmethod
+    def _from_cells(cls, cells):
+        spans = []
+        for st, ch in cells:
+            if spans and spans[-1][0] == st:
+                spans[-1][1].append(ch)
+            else:
+                spans.append((st, [ch]))
+        return cls((st, ''.join(chs)) for st, chs in spans)
+
+    def __str__(self):
+        return ''.join(st + tx + Ansi.RESET if st else tx for st, tx in self.spans)
+
+    def __add__(self, other):
+        return StyledText(self.spans + StyledText.from_ansi(other).spans)
+
+    def __radd__(self, other):
+        return StyledText(StyledText.from_ansi(other).spans + self.spans)
+
+    def pad(self, width):
+        n = int(width) - self.width
+        return StyledText(self.spans + [('', ' ' * n)]) if n > 0 else self
+
+    def splitlines(self):
+        out = [[]]
+        for st, tx in self.spans:
+            parts = tx.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+            out[-1].append((st, parts[0]))
+            for part in parts[1:]:
+                out.append([(st, part)])
+        return [StyledText(sp) for sp in out]
+
+    def wrap(self, width):
+        """Même découpage que wrap_ansi (coupure au dernier espace, sinon en dur)."""
+        width = max(1, int(width))
+        if self.width <= width and not any('\n' in tx or '\r' in tx for _, tx in self.spans):
+            return [self]
+        out = []
+        cur = []
+        last_space = -1
+        for st, tx in self.spans:
+            for ch in tx:
+                if ch == '\r':
+                    continue
+                if ch == '\n':
+                    out.append(StyledText._from_cells(cur))
+                    cur = []
+                    last_space = -1
+                    continue
+                cur.append((st, ch))
+                if ch.isspace():
+                    last_space = len(cur)
+                if len(cur) > width:
+                    if last_space > 0:
+                        left, cur = cur[:last_space], cur[last_space:]
+                    else:
+                        left, cur = cur[:width], cur[width:]
+                    while left and left[-1][1].isspace():
+                        left.pop()
+                    while cur and cur[0][1].isspace():
+                        cur.pop(0)
+                    out.append(StyledText._from_cells(left))
+                    last_space = -1
+        if cur or not out:
+            out.append(StyledText._from_cells(cur))
+        return out
+
+def visible_len(s) -> int:
+    if isinstance(s, StyledText):
+        return s.width
     return len(_ansi_re.sub("", s))
 
 def _cut_ansi_visible(s: str, max_visible: int):
@@ -231,10 +600,14 @@ def _cut_ansi_visible(s: str, max_visible: int):
 
 def _pad_ansi_right(s: str, width: int) -> str:
     """Pad à droite en se basant sur la largeur visible (ignore les codes ANSI)."""
+    if isinstance(s, StyledText):
+        return s.pad(width)
     return s + (' ' * max(0, int(width) - visible_len(s)))
 
 def wrap_ansi(s: str, width: int) -> list[str]:
     # Wrap robuste: respecte \n et évite de couper les séquences ANSI.
+    if isinstance(s, StyledText):
+        return s.wrap(width)
     width = max(1, int(width))
     out = []
     cur = ""
@@ -278,16 +651,25 @@ def wrap_ansi(s: str, width: int) -> list[str]:
     return out
 
 def draw_box(title: str, lines, width: int | None = None, border_style=None, title_style=None):
-    if isinstance(lines, (str, bytes)):
-        lines = [str(lines)]
+    global MAP_FRAME_ACTIVE
+    # Un popup interrompt la marche: les déplacements tapés d'avance ne doivent pas le traverser.
+    interrupt_type_ahead()
+    # Un popup sous la map peut faire défiler l'écran: la frame suivante repart d'un écran propre.
+    MAP_FRAME_ACTIVE = False
+    if isinstance(lines, (str, bytes, StyledText)):
+        lines = [lines]
+    # Un seul passage ANSI -> segments par ligne; largeurs et wrap se font ensuite sans regex.
     normalized_lines = []
     for x in lines:
+        if isinstance(x, StyledText):
+            normalized_lines.extend(x.splitlines())
+            continue
         txt = str(x).replace('\r\n', '\n').replace('\r', '\n')
-        normalized_lines.extend(txt.split('\n'))
+        normalized_lines.extend(StyledText.from_ansi(part) for part in txt.split('\n'))
     lines = normalized_lines
 
     # largeur mini/maxi + calcul auto selon contenu visible
-    content_w = max((visible_len(l) for l in lines), default=0)
+    content_w = max((l.width for l in lines), default=0)
     title_text = f" {title} "
     target = max(60, content_w, visible_len(title_text), 100)
     width = max(60, min(200, width or target))  # ← max 200
@@ -298,15 +680,15 @@ def draw_box(title: str, lines, width: int | None = None, border_style=None, tit
     top = '┌' + '─'*width + '┐'
     mid = '├' + '─'*width + '┤'
     bot = '└' + '─'*width + '┘'
-    print(c(top, border_style))
-    pad = max(0, width - visible_len(title_text))
-    print(c('│', border_style) + c(title_text + ' '*pad, title_style) + c('│', border_style))
-    print(c(mid, border_style))
-    for ln in lines:
-        for part in wrap_ansi(ln, width):
-            pad = max(0, width - visible_len(part))
-            print(c('│', border_style) + part + ' '*pad + c('│', border_style))
-    print(c(bot, border_style))
+    with FRAME:
+        emit(c(top, border_style))
+        pad = max(0, width - visible_len(title_text))
+        emit(c('│', border_style) + c(title_text + ' '*pad, title_style) + c('│', border_style))
+        emit(c(mid, border_style))
+        for ln in lines:
+            for part in ln.wrap(width):
+                emit(c('│', border_style) + str(part.pad(width)) + c('│', border_style))
+        emit(c(bot, border_style))
 
 # ========================== RENDU DU PERSONNAGE ==========================
 def _tint_line_red(line: str, strong=False):
@@ -314,35 +696,89 @@ def _tint_line_red(line: str, strong=False):
     color = Ansi.BRIGHT_RED if strong else Ansi.RED
     return c(line, color)
 
-def colorize_sprite_by_hp(sprite_lines, hp, max_hp):
-    """
-    Colore le sprite du BAS vers le HAUT en rouge selon la proportion de PV perdus.
-    Plus on a peu de PV, plus de lignes en bas deviennent rouges (et les plus basses en BRIGHT_RED).
-    """
+# Sprites teintés: le résultat ne dépend que de (sprite, nb de lignes rouges) -> ~10 variantes par sprite.
+_SPRITE_TINT_CACHE = {}
+_SPRITE_TINT_CACHE_MAX = 256
+
+def _hp_red_rows(hp, max_hp, h):
     if max_hp <= 0:
         frac_lost = 1.0
     else:
         frac_lost = max(0.0, min(1.0, 1.0 - (hp / max_hp)))
-
-    h = len(sprite_lines)
     # nb de lignes à teinter depuis le BAS (>= 0)
-    red_rows = int(math.ceil(frac_lost * h))
+    return int(math.ceil(frac_lost * h))
 
-    out = []
-    for i, raw in enumerate(sprite_lines):
-        # i = 0 en haut, h-1 en bas -> on teinte si i >= h - red_rows
-        if i >= h - red_rows and red_rows > 0:
-            # intensité : les 1/3 lignes les plus basses = bright
-            # calcule la "profondeur" dans la zone rouge (0 en haut de la zone rouge, 1 tout en bas)
-            depth = (i - (h - red_rows)) / max(1, red_rows - 1)
-            strong = depth > 0.66
-            out.append(_tint_line_red(raw, strong=strong))
+def colorize_sprite_by_hp(sprite_lines, hp, max_hp):
+    """
+    Colore le sprite du BAS vers le HAUT en rouge selon la proportion de PV perdus.
+    Plus on a peu de PV, plus de lignes en bas deviennent rouges (et les plus basses en BRIGHT_RED).
+    """
+    h = len(sprite_lines)
+    red_rows = _hp_red_rows(hp, max_hp, h)
+    key = (tuple(sprite_lines), red_rows, SUPPORTS_ANSI)
+    out = _SPRITE_TINT_CACHE.get(key)
+    if out is None:
+        out = []
+        for i, raw in enumerate(sprite_lines):
+            # i = 0 en haut, h-1 en bas -> on teinte si i >= h - red_rows
+            if i >= h - red_rows and red_rows > 0:
+                # intensité : les 1/3 lignes les plus basses = bright
+                # calcule la "profondeur" dans la zone rouge (0 en haut de la zone rouge, 1 tout en bas)
+                depth = (i - (h - red_rows)) / max(1, red_rows - 1)
+                strong = depth > 0.66
+                out.append(_tint_line_red(raw, strong=strong))
+            else:
+                out.append(raw)  # pas de teinte
+        if len(_SPRITE_TINT_CACHE) >= _SPRITE_TINT_CACHE_MAX:
+            _SPRITE_TINT_CACHE.clear()
+        out = _SPRITE_TINT_CACHE[key] = tuple(out)
+    return list(out)
+
+# Panneau latéral de la map (joueur + invocation) déjà paddé; recalculé seulement si ses entrées changent.
+_SIDE_PANEL_CACHE = {'key': None, 'lines': [], 'width': 0}
+
+def _side_panel(player):
+    """Retourne (lignes paddées, largeur visible) du sprite latéral joueur (+ invocation)."""
+    spr = player.sprite if getattr(player, 'sprite', None) else SPRITES.get('knight', [])
+    summon = _active_summon(player)
+    s_key = None
+    if summon and int(summon.get('hp', 0)) > 0:
+        s_spr = summon.get('map_sprite') or summon.get('sprite', [])
+        s_tint = bool(summon.get('use_hp_tint', True))
+        s_rows = _hp_red_rows(int(summon.get('hp', 1)), int(summon.get('max_hp', 1)), len(s_spr)) if s_tint else 0
+        s_key = (tuple(s_spr), s_tint, s_rows)
+    key = (tuple(spr), _hp_red_rows(player.hp, player.max_hp, len(spr)), s_key, SUPPORTS_ANSI)
+    cache = _SIDE_PANEL_CACHE
+    if cache['key'] == key:
+        return cache['lines'], cache['width']
+
+    spr_colored = colorize_sprite_by_hp(spr, player.hp, player.max_hp)
+    p_w = max((visible_len(x) for x in spr_colored), default=0)
+    if s_key is not None:
+        if s_key[1]:
+            s_col = colorize_sprite_by_hp(s_spr, int(summon.get('hp', 1)), int(summon.get('max_hp', 1)))
         else:
-            out.append(raw)  # pas de teinte
-    return out
+            s_col = s_spr[:]
+        h_side = max(len(spr_colored), len(s_col))
+        s_w = max((visible_len(x) for x in s_col), default=0)
+        side_lines = []
+        for i in range(h_side):
+            pl = spr_colored[i] if i < len(spr_colored) else (" " * p_w)
+            sl = s_col[i] if i < len(s_col) else (" " * s_w)
+            side_lines.append(_pad_ansi_right(pl, p_w) + "  " + _pad_ansi_right(sl, s_w))
+    else:
+        side_lines = [_pad_ansi_right(line, p_w) for line in spr_colored]
+    width = max((visible_len(x) for x in side_lines), default=0)
+    cache.update(key=key, lines=side_lines, width=width)
+    return side_lines, width
 
 # ========================== PARAMÈTRES ==========================
-MAP_W, MAP_H = 48, 20
+MAP_W, MAP_H = 48, 20  # taille des premiers étages, et taille minimale de la fenêtre de carte
+# Les étages s'agrandissent à partir de MAP_GROW_FROM (largeur, hauteur ajoutées par étage), bornés par MAP_MAX_*.
+MAP_GROW_FROM = 10
+MAP_GROW_STEP = (8, 3)
+MAP_MAX_W, MAP_MAX_H = 200, 80
+FOV_LINE_OF_SIGHT = True  # vision arrêtée par les murs (ombre portée); False = losange plein
 FLOOR, WALL = '·', '#'
 PLAYER_ICON, NPC_ICON, MON_ICON, ITEM_ICON, SHOP_ICON = '@','N','M','*','$'
 STAIR_DOWN, STAIR_UP = '>', '<'
@@ -353,12 +789,23 @@ CASINO_ICON = 'C'
 ALTAR_ICON = '+'
 LOCKED_DOOR_ICON = 'D'
 SAGE_ICON = 'S'
-HUD_CONTROLS = '[ZQSD/WASD] déplacer • E interagir • I inventaire • C stats • J journal • M grimoire • X quitter'
-MENU_CONTROLS = "Commandes : ZQSD/WASD se déplacer • E interagir • I inventaire • C stats • J journal • M grimoire • X quitter"
+HUD_CONTROLS = '[ZQSD/WASD] déplacer • E interagir • O explorer • G aller à • I inventaire • C stats • J journal • M grimoire • X quitter'
+MENU_CONTROLS = "Commandes : ZQSD/WASD se déplacer • E interagir • O exploration auto • G aller à • I inventaire • C stats • J journal • M grimoire • X quitter"
 QUICK_SPELL_KEYS = {
     '&': 1, 'é': 2, '"': 3, "'": 4, '(': 5, '-': 6,
     'è': 7, '_': 8, 'ç': 9, 'à': 10,
 }
+# Saisie de nombres: "n5d" avance de 5 sans ambiguïté. "5d" reste accepté si la direction est
+# déjà dans le tampon; avec le préfixe, un chiffre seul est un sort immédiat (aucune attente).
+# Sans préfixe (MOVE_COUNT_PREFIX = ''), on attend DIGIT_COUNT_TIMEOUT une éventuelle direction.
+MOVE_COUNT_PREFIX = 'n'
+FLOOR_LRU_SIZE = 6  # étages gardés entiers en mémoire; les autres sont réduits à graine + delta
+DIGIT_COUNT_TIMEOUT = 0.18
+# Exploration auto (touche O): frames max par seconde pendant la marche (rendu garanti à chaque arrêt),
+# arrêt sous cette fraction des PV max, et nombre de pas max par appui.
+AUTO_EXPLORE_FPS = 15
+AUTO_EXPLORE_MIN_HP = 0.5
+AUTO_EXPLORE_MAX_STEPS = 2000
 
 # ========================== BALANCE ==========================
 BALANCE = {
@@ -1402,23 +1849,111 @@ def clear_screen():
     MAP_FRAME_ACTIVE = False
     # Avec ANSI, on repositionne le curseur puis on efface le buffer écran.
     if SUPPORTS_ANSI:
-        sys.stdout.write("\x1b[H\x1b[2J\x1b[3J")
-        sys.stdout.flush()
+        FRAME.write("\x1b[H\x1b[2J\x1b[3J")
         return
     os.system('cls' if os.name=='nt' else 'clear')
 
-def pause(msg='Appuyez sur Entrée pour continuer...'): input(msg)
+def pause(msg='Appuyez sur Entrée pour continuer...'): read_line(msg)
+
+# ========================== ÉCRAN À DIFFÉRENCES ==========================
+BLANK_CELL = (' ', '')
+
+def ansi_to_cells(line: str) -> list:
+    """Découpe une ligne ANSI en cellules (glyphe, style) ; style = paramètres SGR actifs."""
+    cells = []
+    style = ''
+    i = 0
+    for m in _ansi_re.finditer(line):
+        cells.extend((ch, style) for ch in line[i:m.start()] if ch not in '\r\n')
+        params = m.group(0)[2:-1]
+        head, _, rest = params.partition(';')
+        if head in ('', '0'):
+            style = rest
+        else:
+            style = f"{style};{params}" if style else params
+        i = m.end()
+    cells.extend((ch, style) for ch in line[i:] if ch not in '\r\n')
+    return cells
 
-def begin_frame_redraw():
+class ScreenBuffer:
     """
-    Redessine une frame en évitant l'effacement total (réduit flicker/clipping).
+    Frame précédente de la map en cellules (glyphe, style).
+    diff() ne renvoie que les cellules modifiées: saut de curseur (CUP) par série,
+    un seul SGR par suite de cellules de même style.
     """
-    if SUPPORTS_ANSI:
-        # Repaint map->map: curseur en haut sans full clear (réduit le flicker).
-        sys.stdout.write("\x1b[H")
-        sys.stdout.flush()
-    else:
-        clear_screen()
+    GAP_MERGE = 4  # cellules intactes réécrites plutôt qu'un nouveau CUP (~8 octets)
+
+    def __init__(self):
+        self.rows = []
+        self.cols = 0
+        self.last_bytes = 0
+        self.last_cells = 0
+
+    def invalidate(self):
+        # L'écran a été effacé: la prochaine frame repart d'un écran vide.
+        self.rows = []
+
+    def _physical_rows(self, lines, cols):
+        # Les lignes plus larges que le terminal s'enroulent: on adresse les lignes physiques.
+        rows = []
+        for ln in lines:
+            cells = ansi_to_cells(ln)
+            if not cells:
+                rows.append([])
+            for k in range(0, len(cells), cols):
+                rows.append(cells[k:k + cols])
+        return rows
+
+    def diff(self, lines, cols=None) -> str:
+        cols = max(1, cols or shutil.get_terminal_size((200, 50)).columns)
+        if cols != self.cols:
+            self.cols = cols
+            prev = []
+            out = ["\x1b[H\x1b[2J"]
+        else:
+            prev = self.rows
+            out = []
+        rows = self._physical_rows(lines, cols)
+        cur_style = ''
+        changed = 0
+        for y, new in enumerate(rows):
+            old = prev[y] if y < len(prev) else []
+            width = max(len(old), len(new))
+            x = 0
+            while x < width:
+                if (old[x] if x < len(old) else BLANK_CELL) == (new[x] if x < len(new) else BLANK_CELL):
+                    x += 1
+                    continue
+                # début d'une série: on l'étend tant que les trous restent courts
+                start = end = x
+                gap = 0
+                x += 1
+                while x < width and gap <= self.GAP_MERGE:
+                    if (old[x] if x < len(old) else BLANK_CELL) != (new[x] if x < len(new) else BLANK_CELL):
+                        end = x
+                        gap = 0
+                    else:
+                        gap += 1
+                    x += 1
+                x = end + 1
+                out.append(f"\x1b[{y + 1};{start + 1}H")
+                for ch, style in (new[k] if k < len(new) else BLANK_CELL for k in range(start, end + 1)):
+                    if style != cur_style:
+                        out.append(f"\x1b[0;{style}m" if style else "\x1b[0m")
+                        cur_style = style
+                    out.append(ch)
+                    changed += 1
+        if cur_style:
+            out.append("\x1b[0m")
+        # curseur sous la frame + nettoyage des résidus (messages, frame précédente plus haute)
+        out.append(f"\x1b[{len(rows) + 1};1H\x1b[J")
+        self.rows = rows
+        data = ''.join(out)
+        self.last_bytes = len(data.encode('utf-8'))
+        self.last_cells = changed
+        return data
+
+MAP_SCREEN = ScreenBuffer()
 
 def rarity_color(r):
     return {
@@ -1629,16 +2164,20 @@ def _pick_teleport_destination(floor, player_pos):
     blocked = set(getattr(floor, 'monsters', set()))
     for dx, dy in ((1,0), (-1,0), (0,1), (0,-1)):
         nx, ny = sx + dx, sy + dy
-        if not (0 <= nx < MAP_W and 0 <= ny < MAP_H):
-            continue
-        if floor.grid[ny][nx] != FLOOR:
+        if not floor.is_floor(nx, ny):
             continue
         if (nx, ny) in blocked:
             continue
         candidates.append((nx, ny))
     if not candidates:
         return None
-    candidates.sort(key=lambda p: abs(p[0] - player_pos[0]) + abs(p[1] - player_pos[1]))
+    # Plus proche en distance de marche (champ BFS de l'étage), Manhattan si la case est isolée.
+    field = floor.distance_field(player_pos, cache=False) if hasattr(floor, 'distance_field') else None
+    def walk(p):
+        manhattan = abs(p[0] - player_pos[0]) + abs(p[1] - player_pos[1])
+        d = field[p[1] * floor.w + p[0]] if field is not None else -1
+        return (d < 0, d if d >= 0 else manhattan)
+    candidates.sort(key=walk)
     return candidates[0]
 
 def _explore_stat_spell_values(player, sid):
@@ -2262,7 +2801,7 @@ def choose_floor_destination(current_depth, direction):
     draw_box(title, lines, width=86)
 
     while True:
-        cmd = input("> ").strip().lower()
+        cmd = read_line("> ").strip().lower()
         if cmd in ("q", "x", ""):
             return None
         if cmd.isdigit():
@@ -2435,7 +2974,7 @@ def open_casino(player, depth):
         print()
         draw_box("Panneau upgrade", equip_rows, width=BOX_W)
 
-        cmd = input("> ").strip().lower()
+        cmd = read_line("> ").strip().lower()
         if cmd == "q":
             return
         if cmd == "1":
@@ -2457,7 +2996,7 @@ def open_casino(player, depth):
             if not equipped:
                 print("Aucun objet équipé à upgrader."); time.sleep(0.7); continue
             draw_box("Upgrade casino", [f"{i+1}) {slot}: {item_summary(it)}" for i, (slot, it) in enumerate(equipped)] + ["q) Annuler"], width=BOX_W)
-            pick = input("> ").strip().lower()
+            pick = read_line("> ").strip().lower()
             if pick == "q":
                 continue
             if not pick.isdigit() or not (1 <= int(pick) <= len(equipped)):
@@ -2480,7 +3019,7 @@ def open_casino(player, depth):
             if is_cursed:
                 item_break_chance = _upgrade_break_chance_for_item(old, upgrade_break_chance)
                 if _has_fragment_guard(player):
-                    ask = input("Objet cursed: utiliser 1 fragment pour éviter la casse en cas d'échec ? (o/n) ").strip().lower()
+                    ask = read_line("Objet cursed: utiliser 1 fragment pour éviter la casse en cas d'échec ? (o/n) ").strip().lower()
                     use_fragment_guard = (ask in ('o', 'y'))
                 else:
                     draw_box("Avertissement cursed", [
@@ -2580,7 +3119,7 @@ def open_altar(player, depth):
         "q) Ignorer",
     ]
     draw_box("Sanctuaire ancien", rows, width=88)
-    cmd = input("> ").strip().lower()
+    cmd = read_line("> ").strip().lower()
     if cmd in ("q", ""):
         return False
     if cmd not in ("1", "2"):
@@ -2748,8 +3287,54 @@ def effect_str(special):
     for k,v in special.items(): parts.append(f"{k}={v}" if not isinstance(v,bool) else k)
     return ' | Effets: ' + ', '.join(parts)
 
+class ItemRenderCache:
+    """
+    LRU borné des libellés d'objets en StyledText, clé = (identité de l'objet, mode d'affichage).
+    Les objets sont des namedtuples remplacés (jamais modifiés): l'identité suffit, et l'objet
+    gardé avec son libellé empêche la réutilisation de son id. Vidé si le mode couleur change.
+    """
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._stamp = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, it, mode, build):
+        stamp = (SUPPORTS_ANSI, USE_TRUECOLOR)
+        if stamp != self._stamp:
+            self._data.clear()
+            self._stamp = stamp
+        key = (id(it), mode)
+        hit = self._data.get(key)
+        if hit is not None and hit[0] is it:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return hit[1]
+        self.misses += 1
+        text = build(it)
+        self._data[key] = (it, text)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return text
+
+    def clear(self):
+        self._data.clear()
+
+ITEM_TEXT_CACHE = ItemRenderCache()
+
 def item_summary(it):
+    """Libellé complet en StyledText (str() pour la chaîne ANSI), segmenté une fois par objet."""
     if it is None: return '—'
+    return ITEM_TEXT_CACHE.get(it, 'summary', lambda x: StyledText.from_ansi(_item_summary_text(x)))
+
+def item_brief_stats(it):
+    """Affichage compact pour shop/coffres: bonus + effets, sans légende/description."""
+    if it is None:
+        return '—'
+    return ITEM_TEXT_CACHE.get(it, 'brief', lambda x: StyledText.from_ansi(_item_brief_stats_text(x)))
+
+def _item_summary_text(it):
     if isinstance(it, Consumable):
         return f"{it.name} {rarity_tag(it.rarity)} — {it.description}"
     is_magic = is_magic_item(it)
@@ -2773,10 +3358,7 @@ def item_summary(it):
         f"{details}{s_hp} {s_atk} {s_def} {s_crit}{s_pouv}{effects}"
     )
 
-def item_brief_stats(it):
-    """Affichage compact pour shop/coffres: bonus + effets, sans légende/description."""
-    if it is None:
-        return '—'
+def _item_brief_stats_text(it):
     if isinstance(it, Consumable):
         return item_summary(it)
     is_magic = is_magic_item(it)
@@ -2965,16 +3547,16 @@ def open_inventory(player):
         # === PANNEAU 1 : Fiche & Équipement ===
         top_rows = []
         # Fiche
-        top_rows.append(c('Fiche du héros', Ansi.BRIGHT_WHITE))
+        top_rows.append(StyledText.of('Fiche du héros', Ansi.BRIGHT_WHITE))
         top_rows.append(player.stats_summary())
         top_rows.append('')
 
         # Équipement
-        top_rows.append(c('Équipement', Ansi.BRIGHT_CYAN))
+        top_rows.append(StyledText.of('Équipement', Ansi.BRIGHT_CYAN))
         slots = [('weapon', 'Arme'), ('armor','Armure'), ('accessory','Accessoire')]
         for key,label in slots:
             it = player.equipment.get(key)
-            top_rows.append(f"- {label}: {item_summary(it) if it else '—'}")
+            top_rows.append(f"- {label}: " + item_summary(it) if it else f"- {label}: —")
         top_rows.append('')
 
         # Infos de capacité
@@ -2986,19 +3568,16 @@ def open_inventory(player):
 
         # === PANNEAU 2 : Sac Objets (vendables/équipables) ===
         bag_rows = []
-        bag_rows.append(c('Sac — Objets', Ansi.BRIGHT_MAGENTA))
+        bag_rows.append(StyledText.of('Sac — Objets', Ansi.BRIGHT_MAGENTA))
         if not player.inventory:
-            bag_rows.append(c('(Vide)', Ansi.BRIGHT_BLACK))
+            bag_rows.append(StyledText.of('(Vide)', Ansi.BRIGHT_BLACK))
         else:
             for i, it in enumerate(player.inventory, 1):
-                label = item_summary(it)
-                if not isinstance(it, Consumable):
-                    # déjà coloré dans item_summary (bleu magique + tag rareté coloré)
-                    pass
-                bag_rows.append(f"{i:>2}) {label}   {preview_delta(player, it)}")
+                # déjà coloré dans item_summary (bleu magique + tag rareté coloré)
+                bag_rows.append(f"{i:>2}) " + item_summary(it) + f"   {preview_delta(player, it)}")
 
         bag_rows.append('')
-        bag_rows.append(c('Actions objets :', Ansi.BRIGHT_WHITE))
+        bag_rows.append(StyledText.of('Actions objets :', Ansi.BRIGHT_WHITE))
         bag_rows.append(" - e<num> : équiper l’objet")
         bag_rows.append(" - d<num> : jeter l’objet")
         bag_rows.append(" - s<num> : détails de l’objet")
@@ -3006,34 +3585,35 @@ def open_inventory(player):
 
         # === PANNEAU 3 : Sac Consommables (non vendables) ===
         conso_rows = []
-        conso_rows.append(c('Sac — Consommables (non vendables)', Ansi.BRIGHT_CYAN))
+        conso_rows.append(StyledText.of('Sac — Consommables (non vendables)', Ansi.BRIGHT_CYAN))
         cons = _consumable_stacks(player)
         if not cons:
-            conso_rows.append(c('(Vide)', Ansi.BRIGHT_BLACK))
+            conso_rows.append(StyledText.of('(Vide)', Ansi.BRIGHT_BLACK))
         else:
             for i, st in enumerate(cons, 1):
                 cns = st['item']
                 label = item_summary(cns)
                 if str(getattr(cns, 'effect', '')).startswith('frag_'):
-                    label = c(label, consumable_display_color(cns))
-                conso_rows.append(f"{i:>2}) {label}  x{st['qty']}")
+                    label = StyledText.from_ansi(c(label, consumable_display_color(cns)))
+                conso_rows.append(f"{i:>2}) " + label + f"  x{st['qty']}")
 
         conso_rows.append('')
-        conso_rows.append(c('Actions consommables :', Ansi.BRIGHT_WHITE))
+        conso_rows.append(StyledText.of('Actions consommables :', Ansi.BRIGHT_WHITE))
         conso_rows.append(" - uc<num> : utiliser le consommable")
         conso_rows.append(" - ucm<num> / ucmax<num> : utiliser toute la pile du consommable")
         conso_rows.append(" - dc<num> : jeter 1 unité du consommable")
 
         # === Rendu ===
-        clear_screen()
-        draw_box('Inventaire — Fiche & Équipement', top_rows, width=BOX_W)
-        print()
-        draw_box('Inventaire — Sac Objets', bag_rows, width=BOX_W)
-        print()
-        draw_box('Inventaire — Sac Consommables', conso_rows, width=BOX_W)
+        with FRAME:
+            clear_screen()
+            draw_box('Inventaire — Fiche & Équipement', top_rows, width=BOX_W)
+            emit()
+            draw_box('Inventaire — Sac Objets', bag_rows, width=BOX_W)
+            emit()
+            draw_box('Inventaire — Sac Consommables', conso_rows, width=BOX_W)
 
         # === Saisie ===
-        cmd = input('> ').strip().lower()
+        cmd = read_line('> ').strip().lower()
         if cmd == 'q':
             break
 
@@ -3390,7 +3970,7 @@ def open_spellbook(player, depth, floor=None, player_pos=None):
         ]
         clear_screen()
         draw_box("Grimoire", rows, width=max(120, MAP_W + 42))
-        cmd = input("> ").strip().lower()
+        cmd = read_line("> ").strip().lower()
         if cmd in ("q", ""):
             return player_pos
         if cmd.isdigit():
@@ -3442,7 +4022,7 @@ def open_sage_spell_offer(player, depth):
         rows.append(f"{i}) {_display_spell(sp, player)}")
     rows.append("q) Refuser")
     _draw_sage_dialog("Sorcier — Offrande", rows, width=max(96, MAP_W + 26), side_by_side=True)
-    cmd = input("> ").strip().lower()
+    cmd = read_line("> ").strip().lower()
     if cmd.isdigit() and 1 <= int(cmd) <= len(picks):
         sid = picks[int(cmd)-1]
         sp = _spell_by_id(sid)
@@ -3462,15 +4042,15 @@ def _combat_panel(player, monster, mname, sprite_m, depth, summon=None):
     p_sprite = player.sprite if getattr(player, 'sprite', None) else SPRITES.get('knight', [])
     p_col = colorize_sprite_by_hp(p_sprite, player.hp, player.max_hp)
     right = sprite_m[:]
-    left = p_col[:]
-    lines.append(c("Vous", Ansi.BRIGHT_GREEN))
+    left = [StyledText.from_ansi(x) for x in p_col]
+    lines.append(StyledText.of("Vous", Ansi.BRIGHT_GREEN))
 
     h = max(len(left), len(right))
-    left_w = max((visible_len(x) for x in left), default=20) + 2
-    left = left + ['' for _ in range(h-len(left))]
+    left_w = max((x.width for x in left), default=20) + 2
+    left = left + [StyledText() for _ in range(h-len(left))]
     right = right + ['' for _ in range(h-len(right))]
     for la, rb in zip(left, right):
-        lines.append(la + (' ' * max(0, left_w - visible_len(la))) + "    " + rb)
+        lines.append(la.pad(left_w) + "    " + rb)
     # Affichage des PV
     if summon and int(summon.get('hp', 0)) > 0:
         summon_name = summon.get('name', 'Invocation')
@@ -3500,7 +4080,8 @@ def _combat_panel(player, monster, mname, sprite_m, depth, summon=None):
         if frag.get('crit_flat', 0.0) > 0: frag_parts.append(f"CRIT +{frag['crit_flat']:.2f}")
         if frag_parts:
             lines.append(c(f"Fragments actifs ({frag['fights_left']} combats): " + " • ".join(frag_parts), Ansi.BRIGHT_MAGENTA))
-    clear_screen(); draw_box(f"Combat — Étage {depth}", lines, width=max(MAP_W, 80))
+    with FRAME:
+        clear_screen(); draw_box(f"Combat — Étage {depth}", lines, width=max(MAP_W, 80))
 
 def _use_combat_consumable(player):
     cons = _consumable_stacks(player)
@@ -3509,7 +4090,7 @@ def _use_combat_consumable(player):
     rows = [f"{i+1}) {item_summary(st['item'])}  x{st['qty']}" for i, st in enumerate(cons)]
     rows += ["q) Retour"]
     draw_box("Consommables", rows, width=max(96, MAP_W + 26))
-    s = input('> ').strip().lower()
+    s = read_line('> ').strip().lower()
     if s in ('q', ''):
         return False
     if not s.isdigit():
@@ -3546,7 +4127,7 @@ def _cast_combat_spell(player, monster, depth, p_specs, combat_state):
     rows = [f"{i+1}) {_display_spell(_spell_by_id(sid), player)}" for i, (_, sid) in enumerate(choices)]
     rows += ["q) Annuler"]
     draw_box("Lancer un sort", rows, width=max(96, MAP_W + 26))
-    cmd = input("> ").strip().lower()
+    cmd = read_line("> ").strip().lower()
     if cmd in ("q", ""):
         return False, None, None
     if not cmd.isdigit() or not (1 <= int(cmd) <= len(choices)):
@@ -3812,7 +4393,7 @@ def fight(player, depth, boss=False):
         used_conso = False
         summon = _active_summon(player)
         _combat_panel(player, monster, mdef['name'], sprite_m, depth, summon=summon)
-        cmd=input('> ').strip().lower()
+        cmd=read_line('> ').strip().lower()
         if cmd=='1':
             atk_specs = dict(p_specs)
             if combat_state.get('enemy_def_shred_turns', 0) > 0:
@@ -4004,13 +4585,13 @@ def fight(player, depth, boss=False):
 # ========================== QUÊTES ==========================
 NPC_NAMES = ['Alia','Borin','Cedric','Dara','Elio','Fara','Gunnar','Hilda','Ilan','Jora']
 
-def make_quest(kind, player_level, giver_pos, giver_name, giver_floor):
-    qid = random.randint(1000,9999)
+def make_quest(kind, player_level, giver_pos, giver_name, giver_floor, rng=random):
+    qid = rng.randint(1000,9999)
     if kind=='slay':
-        target = random.choice(['goblin','skeleton','esprit','slime','diable']); amount = random.randint(2,4)
+        target = rng.choice(['goblin','skeleton','esprit','slime','diable']); amount = rng.randint(2,4)
         reward_xp = 12 + 4*amount + player_level*2; reward_gold = 10 + 5*amount + player_level*2
     else:
-        target = 'combats'; amount = random.randint(2,3)
+        target = 'combats'; amount = rng.randint(2,3)
         reward_xp = 14 + 6*amount + player_level*2; reward_gold = 12 + 4*amount + player_level*2
     reward_xp   = int(reward_xp   * BALANCE['quest_xp_mult'])
     reward_gold = int(reward_gold * BALANCE['quest_gold_mult'])
@@ -4049,11 +4630,17 @@ def journal(player):
     clear_screen(); draw_box('Journal de quêtes', rows, width=max(MAP_W, 80)); pause()
 
 # ========================== CARTE & ÉTAGES ==========================
-def _monsters_per_floor(depth):
+def floor_size(depth):
+    # (largeur, hauteur) de l'étage: MAP_W x MAP_H en surface, plus grand en profondeur.
+    steps = max(0, depth - MAP_GROW_FROM + 1)
+    return (max(MAP_W, min(MAP_MAX_W, MAP_W + steps * MAP_GROW_STEP[0])),
+            max(MAP_H, min(MAP_MAX_H, MAP_H + steps * MAP_GROW_STEP[1])))
+
+def _monsters_per_floor(depth, rng=random):
     # Nombre de monstres aléatoire par étage, avec une plage qui monte doucement.
     low = max(4, 5 + depth // 2)
     high = max(low + 1, 8 + depth + depth // 2)
-    return random.randint(low, high)
+    return rng.randint(low, high)
 
 def _map_items_per_floor(depth):
     # Les étages initiaux restent sobres; la densité d'objets monte ensuite.
@@ -4063,48 +4650,248 @@ def _map_items_per_floor(depth):
         (10, 4),
     ])
 
+FLOOR_POI_RESERVE = 8  # cases libres gardées pour les POIs placés après monstres et objets
+
+class FloorFullError(RuntimeError):
+    """Plus aucune case de sol libre pour placer un élément d'étage."""
+
+class FreeCells:
+    """Cases de sol libres: tirage aléatoire et retrait en O(1) (liste + index, swap-pop)."""
+    __slots__ = ('cells', 'index')
+
+    def __init__(self, cells=()):
+        self.cells = list(cells)
+        self.index = {p: i for i, p in enumerate(self.cells)}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, pos):
+        return pos in self.index
+
+    def discard(self, pos):
+        i = self.index.pop(pos, None)
+        if i is None:
+            return False
+        last = self.cells.pop()
+        if i < len(self.cells):
+            self.cells[i] = last
+            self.index[last] = i
+        return True
+
+    def pick(self, rng=random):
+        if not self.cells:
+            raise FloorFullError("Étage plein: aucune case de sol libre.")
+        return self.cells[rng.randrange(len(self.cells))]
+
+class Occupancy:
+    """
+    Sol creusé en masques de bits, un entier par ligne (bit x = case (x, y)). Tenu à jour
+    à chaque case creusée: "ce rectangle est-il vide ?" coûte un ET par ligne.
+    """
+    __slots__ = ('rows',)
+
+    def __init__(self, h):
+        self.rows = [0] * h
+
+    def add(self, x, y):
+        self.rows[y] |= 1 << x
+
+    def add_span(self, x, w, y):
+        self.rows[y] |= ((1 << w) - 1) << x
+
+    def has(self, x, y):
+        return self.rows[y] >> x & 1
+
+    def empty(self, x, y, w, h):
+        mask = ((1 << w) - 1) << x
+        return not any(r & mask for r in self.rows[y:y+h])
+
+    def span(self, x, w, y):
+        # Abscisses des cases de sol de la ligne y dans [x, x+w).
+        bits = self.rows[y] >> x & ((1 << w) - 1)
+        return [x + i for i in range(w) if bits >> i & 1]
+
+class CellBits:
+    """
+    Ensemble de cases d'un étage en bitset (bit y*w + x d'un bytearray): brouillard, vision,
+    POIs vus. API d'ensemble (in, add, |=, itération); l'union de deux bitsets est un OU entier,
+    et bytes(bits) se sauvegarde tel quel.
+    """
+    __slots__ = ('w', 'h', 'bits')
+
+    def __init__(self, w, h, data=None):
+        self.w, self.h = w, h
+        self.bits = bytearray(data) if data is not None else bytearray((w * h + 7) // 8)
+
+    def __contains__(self, pos):
+        x, y = pos
+        if not (0 <= x < self.w and 0 <= y < self.h):
+            return False
+        k = y * self.w + x
+        return bool(self.bits[k >> 3] >> (k & 7) & 1)
+
+    def add(self, pos):
+        k = pos[1] * self.w + pos[0]
+        self.bits[k >> 3] |= 1 << (k & 7)
+
+    def discard(self, pos):
+        x, y = pos
+        if 0 <= x < self.w and 0 <= y < self.h:
+            k = y * self.w + x
+            self.bits[k >> 3] &= ~(1 << (k & 7)) & 0xFF
+
+    def __ior__(self, other):
+        if isinstance(other, CellBits):
+            n = len(self.bits)
+            self.bits[:] = (int.from_bytes(self.bits, 'little') | int.from_bytes(other.bits, 'little')).to_bytes(n, 'little')
+        else:
+            for pos in other:
+                self.add(pos)
+        return self
+
+    def __iter__(self):
+        w, bits = self.w, self.bits
+        for i, byte in enumerate(bits):
+            while byte:
+                low = byte & -byte
+                k = (i << 3) + low.bit_length() - 1
+                yield (k % w, k // w)
+                byte ^= low
+
+    def __len__(self):
+        return int.from_bytes(self.bits, 'little').bit_count()
+
+    def __eq__(self, other):
+        if isinstance(other, CellBits):
+            return (self.w, self.h, self.bits) == (other.w, other.h, other.bits)
+        return set(self) == set(other)
+
+    __hash__ = None  # mutable: comme set, pas de hash
+
+    def __bytes__(self):
+        return bytes(self.bits)
+
+# Stockage compact des étages: une case = un octet (bytearray), y*w + x (w = largeur de l'étage).
+TILE_WALL, TILE_FLOOR = 0, 1
+TILE_CHARS = (WALL, FLOOR)
+# Calque des POIs: un octet par case, 0 = rien, sinon indice du type dans POI_KINDS.
+POI_KINDS = (None, 'up', 'down', 'shop', 'npc', 'sage', 'treasure', 'boss_treasure', 'altar', 'casino', 'elite', 'door')
+POI_CODES = {kind: code for code, kind in enumerate(POI_KINDS)}
+TILE_CODES = {WALL: TILE_WALL, FLOOR: TILE_FLOOR}
+
+class _GridRow:
+    __slots__ = ('tiles', 'base', 'w')
+
+    def __init__(self, tiles, base, w):
+        self.tiles, self.base, self.w = tiles, base, w
+
+    def __getitem__(self, x):
+        if not 0 <= x < self.w:
+            raise IndexError(x)
+        return TILE_CHARS[self.tiles[self.base + x]]
+
+    def __setitem__(self, x, ch):
+        if not 0 <= x < self.w:
+            raise IndexError(x)
+        self.tiles[self.base + x] = TILE_CODES[ch]
+
+    def __len__(self):
+        return self.w
+
+    def __iter__(self):
+        return (TILE_CHARS[t] for t in self.tiles[self.base:self.base + self.w])
+
+class GridView:
+    """Vue compat grid[y][x] -> FLOOR/WALL (lecture et écriture) sur les tuiles d'un étage."""
+    __slots__ = ('tiles', 'w', 'h')
+
+    def __init__(self, tiles, w, h):
+        self.tiles, self.w, self.h = tiles, w, h
+
+    def __getitem__(self, y):
+        if not 0 <= y < self.h:
+            raise IndexError(y)
+        return _GridRow(self.tiles, y * self.w, self.w)
+
+    def __len__(self):
+        return self.h
+
+    def __iter__(self):
+        return (self[y] for y in range(self.h))
+
 class Floor:
-    def __init__(self,depth):
+    __slots__ = (
+        'depth', 'w', 'h', 'tiles', 'start', 'up', 'down', 'theme', 'overlay',
+        'npcs', 'sages', 'shops', 'monsters', 'items',
+        'treasures', 'boss_treasures', 'treasure_types', 'locked_doors', 'elites', 'altars', 'casinos',
+        'discovered', 'visible', 'seen', '_fov_at',
+        'seed', 'gen_stats', '_rng', '_first_room_center', '_free', '_dist_fields', '_fov_cache', '_occ', '_locked_cells',
+        '_removed',
+    )
+
+    def __init__(self, depth, seed=None, size=None):
         self.depth=depth
+        self.w, self.h = w, h = size or floor_size(depth)
+        # Densité constante: pièces, monstres et objets suivent la surface de l'étage.
+        scale = (w * h) / (MAP_W * MAP_H)
+        # Générateur propre à l'étage: même graine -> même étage, quel que soit le thread ou
+        # l'état du random global (tirages de combat, etc.).
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self._rng = rng = random.Random(self.seed)
         # Génération "Zelda‑like" : pièces + couloirs droits
-        self.grid = [[WALL for _ in range(MAP_W)] for _ in range(MAP_H)]
-        self._carve_rooms_and_corridors(room_attempts=18, min_size=4, max_size=8)
+        self.tiles = bytearray(w * h)  # TILE_WALL partout
+        self._occ = Occupancy(h)
+        self._locked_cells = set()
+        # Métriques de génération: tirages rejetés (pièces, salles verrouillées), POIs hors
+        # de la région du départ, couloirs creusés pour les y relier.
+        self.gen_stats = {'retries': 0, 'unreachable': 0, 'repairs': 0}
+        self._carve_rooms_and_corridors(room_attempts=max(18, round(18 * scale)), min_size=4, max_size=8)
+        # Champs de distance de marche par point de référence (voir distance_field).
+        self._dist_fields = {}
+        # Champs de vision (ombre portée) par (position, rayon), voir line_of_sight.
+        self._fov_cache = {}
+        # Index des cases de sol libres: chaque placement y pioche puis retire sa case.
+        tiles = self.tiles
+        self._free = FreeCells((x, y) for y in range(1, h-1) for x in range(1, w-1) if tiles[y*w + x] == TILE_FLOOR)
         # Start dans la 1ère pièce
         self.start = self._first_room_center
-        occ=set([self.start])
+        self._free.discard(self.start)
         # Escaliers écartés
-        self.up = None if depth==0 else self._far_floor_pos(self.start, min_dist=18, occupied=occ)
-        if self.up: occ.add(self.up)
-        self.down = self._far_floor_pos(self.up or self.start, min_dist=20, occupied=occ); occ.add(self.down)
+        self.up = None if depth==0 else self._far_floor_pos(self.start, min_dist=18)
+        self.down = self._far_floor_pos(self.up or self.start, min_dist=20)
 
         # PNJ avec quêtes
         self.npcs = {}
-        npc_count = random.randint(BALANCE['npcs_min'], BALANCE['npcs_max'])
+        npc_count = rng.randint(BALANCE['npcs_min'], BALANCE['npcs_max'])
         for _ in range(npc_count):
-            pos = self._random_floor_pos(occ); occ.add(pos)
-            name = random.choice(NPC_NAMES); kind = random.choice(['slay','survive'])
-            self.npcs[pos] = {'name': name, 'quest': make_quest(kind, depth, pos, name, depth)}
+            pos = self._random_floor_pos()
+            name = rng.choice(NPC_NAMES); kind = rng.choice(['slay','survive'])
+            self.npcs[pos] = {'name': name, 'quest': make_quest(kind, depth, pos, name, depth, rng=rng)}
         self.sages = set()
         sage_start = BALANCE.get('spell_sage_start_depth', 3)
         sage_every = max(1, BALANCE.get('spell_sage_every', 5))
         if depth >= sage_start and ((depth - sage_start) % sage_every == 0):
-            spos = self._far_floor_pos(self.start, min_dist=12, occupied=occ)
+            spos = self._far_floor_pos(self.start, min_dist=12)
             if spos:
                 self.sages.add(spos)
-                occ.add(spos)
 
         # Shops
         self.shops=set()
-        if random.random()<0.5 or depth%2==0:
-            s=self._random_floor_pos(occ); self.shops.add(s); occ.add(s)
+        if rng.random()<0.5 or depth%2==0:
+            self.shops.add(self._random_floor_pos())
         # Monstres & Items
+        # Sur un petit étage profond, les monstres sont plafonnés pour laisser la place aux objets
+        # et aux POIs placés ensuite (trésors, élite, autel, casino).
+        item_count = max(1, round(_map_items_per_floor(depth) * scale))
+        monster_cap = max(0, len(self._free) - item_count - FLOOR_POI_RESERVE)
         self.monsters=set()
-        for _ in range(_monsters_per_floor(depth)):
-            pos=self._random_floor_pos(occ); occ.add(pos); self.monsters.add(pos)
+        for _ in range(min(round(_monsters_per_floor(depth, rng) * scale), monster_cap)):
+            self.monsters.add(self._random_floor_pos())
         self.items = set()
         # Items aléatoires, au moins 1 par étage
-        for _ in range(_map_items_per_floor(depth)):
-            pos = self._random_floor_pos(occ); occ.add(pos); self.items.add(pos)
+        for _ in range(item_count):
+            self.items.add(self._random_floor_pos())
 
         # Trésors
         self.treasures = set()
@@ -4114,98 +4901,223 @@ class Floor:
         # Salles verrouillées
         self.locked_doors = {}
         for _ in range(BALANCE.get('locked_rooms_per_floor', 1)):
-            self._add_locked_room(occ, chest_type='normal')
-        boss_room = (depth > 0 and depth % 5 == 0) or (random.random() < BALANCE.get('boss_locked_room_chance', 0.0))
+            self._add_locked_room(chest_type='normal')
+        boss_room = (depth > 0 and depth % 5 == 0) or (rng.random() < BALANCE.get('boss_locked_room_chance', 0.0))
         if boss_room:
-            self._add_locked_room(occ, chest_type='boss')
+            self._add_locked_room(chest_type='boss')
 
         # Trésors additionnels (au moins 1 par étage)
-        tpos = self._far_floor_pos(self.start, min_dist=10, occupied=occ)
+        tpos = self._far_floor_pos(self.start, min_dist=10)
         if tpos:
             self.treasures.add(tpos)
             self.treasure_types[tpos] = 'normal'
-            occ.add(tpos)
-        if random.random()<0.25:
-            t2 = self._random_floor_pos(occ)
+        if rng.random()<0.25:
+            t2 = self._random_floor_pos()
             self.treasures.add(t2)
             self.treasure_types[t2] = 'normal'
-            occ.add(t2)
         # Fog & POIs vus
-        self.discovered=set(); self.visible=set()
-        self.seen_shops=set(); self.seen_npcs=set(); self.seen_stairs=set(); self.seen_treasures=set()
-        self.seen_altars=set(); self.seen_casinos=set(); self.seen_sages=set()
+        # Bitsets de cases: découvertes, visibles, POIs déjà vus (affichés ensuite hors champ).
+        self.discovered = CellBits(w, h); self.visible = CellBits(w, h); self.seen = CellBits(w, h)
+        self._fov_at = None
         self.elites = set()
         if depth > 0 and depth % 5 == 0:
-            epos = self._far_floor_pos(self.start, min_dist=14, occupied=occ)
+            epos = self._far_floor_pos(self.start, min_dist=14)
             if epos:
                 self.elites.add(epos)
-                occ.add(epos)
 
         # Sanctuaires / Autels
         self.altars = set()
         altar_chance = BALANCE['altar_on_boss_floor_chance'] if depth > 0 and depth % 5 == 0 else BALANCE['altar_spawn_chance']
-        if random.random() < altar_chance:
-            apos = self._random_floor_pos(occ)
-            self.altars.add(apos)
-            occ.add(apos)
+        if rng.random() < altar_chance:
+            self.altars.add(self._random_floor_pos())
 
         # Casino: tous les 5 étages
         self.casinos = set()
         if depth > 0 and depth % 5 == 0:
-            cpos = self._far_floor_pos(self.start, min_dist=8, occupied=occ)
+            cpos = self._far_floor_pos(self.start, min_dist=8)
             if cpos:
                 self.casinos.add(cpos)
-                occ.add(cpos)
 
         def _pick_theme(depth):
         # Variante simple : cycler selon la profondeur
             return THEMES[depth % len(THEMES)]
 
         self.theme = _pick_theme(depth)
+        self._ensure_connected()
+        self.rebuild_overlay()
+        # Inutiles une fois l'étage construit: état du générateur (~2,5 Ko), index des cases libres
+        # (~540 Ko en 200x80) et champs de distance des placements (~256 Ko).
+        del self._rng
+        del self._free
+        self._dist_fields.clear()
+        # Retraits depuis la génération, notés au fil du jeu: to_delta n'a rien à recalculer.
+        self._removed = {'monsters': set(), 'items': set(), 'treasures': set(), 'doors': set(), 'elites': set(), 'altars': set()}
+
+    # --- Éviction: étage réduit à graine + delta, reconstruit à l'identique ---
+    def to_delta(self):
+        r = self._removed
+        return FloorDelta(
+            self.depth, self.seed, (self.w, self.h), bytes(self.discovered), bytes(self.seen),
+            frozenset(r['monsters']), frozenset(r['items']), frozenset(r['treasures']),
+            frozenset(r['doors']), frozenset(r['elites']), frozenset(r['altars']),
+        )
+
+    @classmethod
+    def from_delta(cls, delta):
+        fl = cls(delta.depth, seed=delta.seed, size=delta.size)
+        for pos in delta.removed_monsters: fl.remove_monster(pos)
+        for pos in delta.removed_items: fl.take_item(pos)
+        for pos in delta.opened_treasures: fl.open_treasure(pos)
+        for pos in delta.opened_doors: fl.unlock_door(pos)
+        for pos in delta.cleared_elites: fl.clear_elite(pos)
+        for pos in delta.used_altars: fl.use_altar(pos)
+        fl.discovered = CellBits(*delta.size, delta.discovered)
+        fl.seen = CellBits(*delta.size, delta.seen)
+        return fl
+
+    # --- Tuiles ---
+    @property
+    def grid(self):
+        # Compat: grid[y][x] == FLOOR/WALL comme l'ancienne liste de listes.
+        return GridView(self.tiles, self.w, self.h)
+
+    def is_floor(self, x, y):
+        return 0 <= x < self.w and 0 <= y < self.h and self.tiles[y*self.w + x] == TILE_FLOOR
+
+    def _set_floor(self, x, y):
+        self.tiles[y*self.w + x] = TILE_FLOOR
+        self._occ.add(x, y)
+
+    def _carve_rect(self, x, y, w, h):
+        for yy in range(y, y+h):
+            base = yy*self.w + x
+            self.tiles[base:base+w] = bytes((TILE_FLOOR,)) * w
+            self._occ.add_span(x, w, yy)
+
+    # --- Calque des POIs: un type de POI (ou None) par case, lu tel quel par render_map ---
+    def _poi_kind_at(self, pos):
+        # Même priorité que l'ancien rendu case par case.
+        if self.up and pos == self.up: return 'up'
+        if pos == self.down: return 'down'
+        if pos in self.shops: return 'shop'
+        if pos in self.npcs: return 'npc'
+        if pos in self.sages: return 'sage'
+        if pos in self.treasures: return 'boss_treasure' if pos in self.boss_treasures else 'treasure'
+        if pos in self.altars: return 'altar'
+        if pos in self.casinos: return 'casino'
+        if pos in self.elites: return 'elite'
+        if pos in self.locked_doors: return 'door'
+        return None
+
+    def rebuild_overlay(self):
+        self.overlay = bytearray(self.w * self.h)
+        pois = [self.up, self.down, *self.shops, *self.npcs, *self.sages, *self.treasures,
+                *self.altars, *self.casinos, *self.elites, *self.locked_doors]
+        for pos in pois:
+            if pos:
+                self.refresh_overlay(pos)
+
+    def refresh_overlay(self, pos):
+        self.overlay[pos[1] * self.w + pos[0]] = POI_CODES[self._poi_kind_at(pos)]
+
+    # --- Retraits en jeu: tenus à jour dans _removed pour to_delta ---
+    def remove_monster(self, pos):
+        if pos in self.monsters:
+            self.monsters.discard(pos)
+            self._removed['monsters'].add(pos)
+
+    def take_item(self, pos):
+        if pos in self.items:
+            self.items.discard(pos)
+            self._removed['items'].add(pos)
+
+    # --- Registre des POIs: calque (type par case) + état par type + bitset seen ---
+    def poi_kind(self, pos):
+        x, y = pos
+        if not (0 <= x < self.w and 0 <= y < self.h):
+            return None
+        return POI_KINDS[self.overlay[y * self.w + x]]
 
-    def _add_locked_room(self, occupied, chest_type='normal'):
+    def poi(self, pos):
+        """Poi(type, état, déjà vu) de la case pos, ou None: une lecture du calque."""
+        kind = self.poi_kind(pos)
+        if kind is None:
+            return None
+        if kind == 'npc':
+            state = self.npcs[pos]
+        elif kind in ('treasure', 'boss_treasure'):
+            state = self.treasure_types.get(pos)
+        elif kind == 'door':
+            state = self.locked_doors[pos]
+        else:
+            state = None
+        return Poi(kind, state, pos in self.seen)
+
+    def mark_seen(self, cells):
+        # Découverte des POIs: seules les cases nouvellement visibles sont lues.
+        overlay, seen, W = self.overlay, self.seen, self.w
+        for x, y in cells:
+            if overlay[y * W + x]:
+                seen.add((x, y))
+
+    def open_treasure(self, pos):
+        if pos in self.treasures:
+            self._removed['treasures'].add(pos)
+        self.boss_treasures.discard(pos)
+        self.treasure_types.pop(pos, None)
+        self.treasures.discard(pos)
+        self.refresh_overlay(pos)
+
+    def clear_elite(self, pos):
+        if pos in self.elites:
+            self._removed['elites'].add(pos)
+        self.elites.discard(pos)
+        self.refresh_overlay(pos)
+
+    def unlock_door(self, pos):
+        if self.locked_doors.pop(pos, None) is not None:
+            self._removed['doors'].add(pos)
+        self._set_floor(*pos)
+        self.refresh_overlay(pos)
+        self._dist_fields.clear()  # la salle ouverte change les distances de marche
+        self._fov_cache.clear()    # ... et ce que l'on voit
+        self._fov_at = None
+
+    def use_altar(self, pos):
+        if pos in self.altars:
+            self._removed['altars'].add(pos)
+        self.altars.discard(pos)
+        self.refresh_overlay(pos)
+
+    def _add_locked_room(self, chest_type='normal'):
         # Petite salle 3x3 derrière une porte verrouillée.
+        occ = self._occ
         for _ in range(400):
             w, h = 3, 3
-            x = random.randint(2, MAP_W - w - 3)
-            y = random.randint(2, MAP_H - h - 3)
-            if any(self.grid[yy][xx] == FLOOR for yy in range(y-1, y+h+1) for xx in range(x-1, x+w+1)):
+            x = self._rng.randint(2, self.w - w - 3)
+            y = self._rng.randint(2, self.h - h - 3)
+            if not occ.empty(x-1, y-1, w+2, h+2):
+                self.gen_stats['retries'] += 1
                 continue
 
-            # Choisir une case murale voisine d'un sol existant qui servira de porte
-            border_candidates = []
-            for xx in range(x, x+w):
-                border_candidates.extend([(xx, y-1), (xx, y+h)])
-            for yy in range(y, y+h):
-                border_candidates.extend([(x-1, yy), (x+w, yy)])
-            random.shuffle(border_candidates)
-
-            door = None
-            for bx, by in border_candidates:
-                if not (1 <= bx < MAP_W-1 and 1 <= by < MAP_H-1):
-                    continue
-                # Adjacent à du sol existant pour que le joueur puisse tenter l'ouverture.
-                around = [(bx+1,by), (bx-1,by), (bx,by+1), (bx,by-1)]
-                if any(self.grid[ay][ax] == FLOOR for ax, ay in around if 0 <= ax < MAP_W and 0 <= ay < MAP_H):
-                    door = (bx, by)
-                    break
-            if not door:
+            # Porte: case du pourtour (mur, la marge est vide) dont le voisin extérieur est du sol,
+            # pour que le joueur puisse tenter l'ouverture.
+            doors = [(xx, y-1) for xx in occ.span(x, w, y-2)] + [(xx, y+h) for xx in occ.span(x, w, y+h+1)]
+            doors += [(x-1, yy) for yy in range(y, y+h) if occ.has(x-2, yy)]
+            doors += [(x+w, yy) for yy in range(y, y+h) if occ.has(x+w+1, yy)]
+            if not doors:
+                self.gen_stats['retries'] += 1
                 continue
+            door = self._rng.choice(doors)
 
-            # Creuse la salle (fermée par la porte verrouillée)
-            for yy in range(y, y+h):
-                for xx in range(x, x+w):
-                    self.grid[yy][xx] = FLOOR
-                    occupied.add((xx, yy))
-
-            dx, dy = door
-            self.grid[dy][dx] = WALL
+            # Creuse la salle (fermée par la porte verrouillée); ses cases n'entrent pas dans l'index libre.
+            # Salle + son pourtour de murs (porte comprise): aucun tunnel de réparation n'y passe.
+            self._carve_rect(x, y, w, h)
+            self._locked_cells.update((xx, yy) for yy in range(y-1, y+h+1) for xx in range(x-1, x+w+1))
             self.locked_doors[door] = chest_type
 
             # Récompense au centre de la salle.
             prize = (x + w//2, y + h//2)
-            if prize not in occupied:
-                occupied.add(prize)
             self.treasures = getattr(self, 'treasures', set())
             self.treasures.add(prize)
             self.treasure_types[prize] = chest_type
@@ -4215,53 +5127,377 @@ class Floor:
         return False
 
     def _carve_rooms_and_corridors(self, room_attempts=16, min_size=4, max_size=8):
+        MW, MH = self.w, self.h
+        occ = self._occ
         rooms=[]
         for _ in range(room_attempts):
-            w = random.randint(min_size, max_size)
-            h = random.randint(min_size, max_size)
-            x = random.randint(1, MAP_W-w-2)
-            y = random.randint(1, MAP_H-h-2)
+            w = self._rng.randint(min_size, max_size)
+            h = self._rng.randint(min_size, max_size)
+            x = self._rng.randint(1, MW-w-2)
+            y = self._rng.randint(1, MH-h-2)
             rect=(x,y,w,h)
-            # collision simple
-            if any(not (x+w < rx or rx+rw < x or y+h < ry or ry+rh < y) for rx,ry,rw,rh in rooms):
+            # collision: la pièce et une case de marge doivent être vides (seules les pièces sont creusées ici)
+            if not occ.empty(x-1, y-1, w+2, h+2):
+                self.gen_stats['retries'] += 1
                 continue
-            for yy in range(y, y+h):
-                for xx in range(x, x+w):
-                    self.grid[yy][xx]=FLOOR
+            self._carve_rect(x, y, w, h)
             rooms.append(rect)
         centers=[(rx+rw//2, ry+rh//2) for rx,ry,rw,rh in rooms]
         if not centers:
             # fallback : grand plus
-            for yy in range(2, MAP_H-2): self.grid[yy][MAP_W//2]=FLOOR
-            for xx in range(2, MAP_W-2): self.grid[MAP_H//2][xx]=FLOOR
-            self._first_room_center=(MAP_W//2, MAP_H//2); return
+            for yy in range(2, MH-2): self._set_floor(MW//2, yy)
+            for xx in range(2, MW-2): self._set_floor(xx, MH//2)
+            self._first_room_center=(MW//2, MH//2); return
         centers.sort()
         self._first_room_center=centers[0]
         for i in range(1, len(centers)):
             x1,y1=centers[i-1]; x2,y2=centers[i]
+            dx, dy = abs(x2-x1) + 1, abs(y2-y1) + 1
             if i%2==0:
-                for x in range(min(x1,x2), max(x1,x2)+1): self.grid[y1][x]=FLOOR
-                for y in range(min(y1,y2), max(y1,y2)+1): self.grid[y][x2]=FLOOR
+                self._carve_rect(min(x1,x2), y1, dx, 1)
+                self._carve_rect(x2, min(y1,y2), 1, dy)
+            else:
+                self._carve_rect(x1, min(y1,y2), 1, dy)
+                self._carve_rect(min(x1,x2), y2, dx, 1)
+
+    def _ensure_connected(self):
+        """
+        Garantie de connexité à la génération: une inondation depuis le départ (champ de distance)
+        étiquette sa région; tout POI, monstre ou objet hors région, ou porte verrouillée sans accès,
+        est relié par le plus court tunnel à travers les murs (jamais par une salle verrouillée
+        ni par ses murs).
+        Retourne le nombre de couloirs creusés.
+        """
+        locked = self._locked_cells
+        targets = [p for p in (self.up, self.down) if p]
+        targets += [*self.shops, *self.npcs, *self.sages, *self.altars, *self.casinos, *self.elites,
+                    *self.monsters, *self.items, *(t for t in self.treasures if t not in locked)]
+        for dx, dy in self.locked_doors:
+            # Accès à la porte: son voisin de sol hors de la salle.
+            targets += [p for p in ((dx+1, dy), (dx-1, dy), (dx, dy+1), (dx, dy-1)) if p not in locked and self.is_floor(*p)]
+        W = self.w
+        field = self.distance_field(self.start)
+        repairs = 0
+        for tx, ty in targets:
+            if field[ty * W + tx] >= 0:
+                continue
+            self.gen_stats['unreachable'] += 1
+            self._tunnel_to_region((tx, ty), field)
+            repairs += 1
+            self._dist_fields.clear()
+            field = self.distance_field(self.start)
+        self.gen_stats['repairs'] += repairs
+        return repairs
+
+    def _tunnel_to_region(self, src, field):
+        # BFS à travers murs et sol (hors bordure, salles verrouillées et leurs murs) jusqu'à la
+        # première case de la région du départ, puis creuse le chemin trouvé.
+        W, H = self.w, self.h
+        blocked = self._locked_cells | set(self.locked_doors)
+        prev = {src: None}
+        q = deque([src])
+        while q:
+            x, y = q.popleft()
+            if field[y * W + x] >= 0:
+                p = (x, y)
+                while p is not None:
+                    self._set_floor(*p)
+                    p = prev[p]
+                return True
+            for n in ((x+1, y), (x-1, y), (x, y+1), (x, y-1)):
+                if 1 <= n[0] < W-1 and 1 <= n[1] < H-1 and n not in prev and n not in blocked:
+                    prev[n] = (x, y)
+                    q.append(n)
+        return False
+
+    DIST_FIELDS_MAX = 8
+    FOV_CACHE_MAX = 32
+
+    def line_of_sight(self, pos, radius):
+        """Indices (y*w + x) des cases visibles depuis pos (voir shadowcast), en cache par (pos, rayon)."""
+        key = (pos, radius)
+        cells = self._fov_cache.get(key)
+        if cells is None:
+            cells = tuple(shadowcast(self.tiles, self.w, self.h, pos, radius))
+            if len(self._fov_cache) >= self.FOV_CACHE_MAX:
+                self._fov_cache.pop(next(iter(self._fov_cache)))
+            self._fov_cache[key] = cells
+        return cells
+
+    def distance_field(self, ref, cache=True):
+        """
+        Distances de marche (BFS 4-voisins sur le sol) depuis ref, à plat (y*w + x),
+        -1 si inaccessible. Mis en cache par point de référence (POI, départ), vidé quand la
+        grille change; cache=False pour une référence de passage (position du joueur), qui
+        n'évincerait que des champs utiles.
+        """
+        field = self._dist_fields.get(ref)
+        if field is not None:
+            return field
+        tiles = self.tiles
+        W, H = self.w, self.h
+        field = [-1] * (W * H)
+        rx, ry = ref
+        field[ry * W + rx] = 0
+        q = deque([(rx, ry)])
+        while q:
+            x, y = q.popleft()
+            nd = field[y * W + x] + 1
+            for nx, ny in ((x+1, y), (x-1, y), (x, y+1), (x, y-1)):
+                if 0 <= nx < W and 0 <= ny < H:
+                    k = ny * W + nx
+                    if tiles[k] == TILE_FLOOR and field[k] < 0:
+                        field[k] = nd
+                        q.append((nx, ny))
+        if not cache:
+            return field
+        if len(self._dist_fields) >= self.DIST_FIELDS_MAX:
+            self._dist_fields.pop(next(iter(self._dist_fields)))
+        self._dist_fields[ref] = field
+        return field
+
+    def farthest_free_cells(self, ref):
+        """(distance de marche max, cases libres à cette distance) depuis ref."""
+        field = self.distance_field(ref) if ref is not None else None
+        best = []; bestd = -1; W = self.w
+        for x, y in self._free.cells:
+            d = 0 if field is None else field[y * W + x]
+            if d > bestd:
+                best = [(x, y)]; bestd = d
+            elif d == bestd:
+                best.append((x, y))
+        return bestd, best
+
+    def _far_floor_pos(self, ref, min_dist=16):
+        # Case libre la plus loin de ref en distance de marche (champ BFS en cache); retirée de l'index.
+        bestd, best = self.farthest_free_cells(ref)
+        if not best or bestd < min_dist:
+            return self._random_floor_pos()
+        pos = self._rng.choice(best)
+        self._free.discard(pos)
+        return pos
+
+    def _random_floor_pos(self):
+        # Tirage O(1) dans l'index des cases libres; FloorFullError si l'étage est plein.
+        pos = self._free.pick(self._rng)
+        self._free.discard(pos)
+        return pos
+
+# Étage "froid": graine + ce qui a changé depuis la génération (voir Floor.to_delta).
+Poi = namedtuple('Poi', 'kind state seen')
+
+FloorDelta = namedtuple('FloorDelta', 'depth seed size discovered seen removed_monsters removed_items '
+                                      'opened_treasures opened_doors cleared_elites used_altars')
+
+def floor_seed(run_seed, depth):
+    # Graine dérivée par étage: indépendante de l'ordre de génération.
+    return (run_seed ^ ((depth + 1) * 0x9E3779B97F4A7C15)) & 0xFFFFFFFFFFFFFFFF
+
+class FloorPrefetcher:
+    """
+    Génère en arrière-plan l'étage suivant pendant l'exploration, pour que la descente "Prudent"
+    soit instantanée; les cibles d'un saut (+2, +3) sont construites à la demande, pour ne pas
+    générer en fond les étages que le saut évite. Chaque étage a sa graine (floor_seed): le
+    résultat est identique qu'il soit préparé par le thread ou construit à la demande.
+    Remise sous verrou (Condition). Compte toutes les constructions (fond et demande).
+    """
+    AHEAD = 1
+
+    def __init__(self, run_seed):
+        self.run_seed = run_seed
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._ready = {}
+        self._failed = {}  # profondeur -> exception levée par la génération dans le thread
+        self._busy = None
+        self._stop = False
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.built = 0          # Floor() construits, en fond ou à la demande
+        self.discarded = 0      # construits en fond puis lâchés sans servir
+        self.built_depths = set()
+
+    def request(self, depths):
+        """Nouvelle fenêtre de pré-génération; les étages préparés hors fenêtre sont lâchés."""
+        wanted = list(depths)
+        with self._cond:
+            for d in [d for d in self._ready if d not in wanted]:
+                del self._ready[d]
+                self.discarded += 1
+            for d in [d for d in self._failed if d not in wanted]:
+                del self._failed[d]
+            self._pending = deque(d for d in self._pending if d in wanted)
+            for d in wanted:
+                if d not in self._ready and d not in self._failed and d != self._busy and d not in self._pending:
+                    self._pending.append(d)
+            if self._pending and self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name='floor-prefetch', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stop:
+                    self._cond.wait()
+                if self._stop:
+                    return
+                depth = self._pending.popleft()
+                self._busy = depth
+            try:
+                fl, err = Floor(depth, seed=floor_seed(self.run_seed, depth)), None
+            except Exception as exc:  # gardée pour take(): le thread continue, personne n'attend en vain
+                fl, err = None, exc
+            with self._cond:
+                if err is None:
+                    self._ready[depth] = fl
+                    self.built += 1
+                    self.built_depths.add(depth)
+                else:
+                    self._failed[depth] = err
+                self._busy = None
+                self._cond.notify_all()
+
+    def take(self, depth):
+        """
+        Étage prêt (attend s'il est en cours), sinon généré ici avec la même graine.
+        Si sa génération a échoué dans le thread, l'exception est relancée ici.
+        """
+        with self._cond:
+            if depth in self._pending:
+                self._pending.remove(depth)
+            while self._busy == depth:
+                self._cond.wait()
+            fl = self._ready.pop(depth, None)
+            err = self._failed.pop(depth, None)
+        if err is not None:
+            raise err
+        if fl is not None:
+            self.hits += 1
+            return fl
+        self.misses += 1
+        fl = Floor(depth, seed=floor_seed(self.run_seed, depth))
+        with self._cond:
+            self.built += 1
+            self.built_depths.add(depth)
+        return fl
+
+    def close(self):
+        with self._cond:
+            self._stop = True
+            self._pending.clear()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+class FloorStore:
+    """
+    Étages par profondeur, matérialisés seulement quand on y entre (descente ou remontée).
+    Les étages sautés par une descente "Audacieux"/"Suicidaire" restent une simple graine.
+    Seuls les max_hot derniers étages visités restent entiers (LRU); les autres sont réduits
+    à un FloorDelta et reconstruits depuis leur graine au retour.
+    """
+    def __init__(self, prefetch, max_hot=None):
+        self.prefetch = prefetch
+        self.max_hot = max(1, FLOOR_LRU_SIZE if max_hot is None else max_hot)
+        self._hot = OrderedDict()
+        self._cold = {}
+        self.deepest = -1
+        self.evicted = 0
+        self.restored = 0
+        self.gen_stats = {'retries': 0, 'unreachable': 0, 'repairs': 0}  # cumul des étages générés
+
+    def __contains__(self, depth):
+        return depth in self._hot or depth in self._cold
+
+    def __getitem__(self, depth):
+        fl = self._hot.get(depth)
+        if fl is not None:
+            self._hot.move_to_end(depth)
+        else:
+            delta = self._cold.pop(depth, None)
+            if delta is not None:
+                fl = Floor.from_delta(delta)
+                self.restored += 1
             else:
-                for y in range(min(y1,y2), max(y1,y2)+1): self.grid[y][x1]=FLOOR
-                for x in range(min(x1,x2), max(x1,x2)+1): self.grid[y2][x]=FLOOR
-
-    def _far_floor_pos(self, ref, min_dist=16, occupied=None):
-        occupied = occupied or set()
-        best=None; bestd=-1
-        for _ in range(8000):
-            x,y=random.randrange(1,MAP_W-1), random.randrange(1,MAP_H-1)
-            if self.grid[y][x]==FLOOR and (x,y) not in occupied:
-                d = 0 if ref is None else abs(x-ref[0])+abs(y-ref[1])
-                if d>=min_dist and d>bestd:
-                    best=(x,y); bestd=d
-        return best or self._random_floor_pos(occupied)
-
-    def _random_floor_pos(self,occupied):
-        for _ in range(6000):
-            x,y=random.randrange(1,MAP_W-1), random.randrange(1,MAP_H-1)
-            if self.grid[y][x]==FLOOR and (x,y) not in occupied: return (x,y)
-        return (MAP_W//2, MAP_H//2)
+                fl = self.prefetch.take(depth)
+                for k, v in fl.gen_stats.items():
+                    self.gen_stats[k] += v
+            self._hot[depth] = fl
+            while len(self._hot) > self.max_hot:
+                old_depth, old = self._hot.popitem(last=False)
+                self._cold[old_depth] = old.to_delta()
+                self.evicted += 1
+        self.deepest = max(self.deepest, depth)
+        return fl
+
+    def prefetch_after(self, depth):
+        self.prefetch.request([d for d in range(depth + 1, depth + 1 + self.prefetch.AHEAD) if d not in self])
+
+    def stats(self) -> dict:
+        # generated = constructions depuis la graine (pré-génération comprise, dont discarded lâchées);
+        # avoided = étages atteints ou dépassés jamais construits (sautés et pas revisités)
+        pf = self.prefetch
+        with pf._cond:
+            built, discarded = pf.built, pf.discarded
+            avoided = self.deepest + 1 - sum(1 for d in pf.built_depths if d <= self.deepest)
+        return {'deepest': self.deepest, 'generated': built, 'discarded': discarded, 'avoided': avoided,
+                'hot': len(self._hot), 'cold': len(self._cold), 'evicted': self.evicted, 'restored': self.restored,
+                **self.gen_stats}
+
+class Frontier:
+    """
+    Frontière d'exploration d'un étage: cases de sol découvertes dont un voisin (4-connexe) intérieur
+    est encore inconnu. Construite une fois, puis tenue à jour avec les seules cases nouvellement
+    découvertes: une découverte ne change l'état que de la case et de ses quatre voisines.
+    """
+    __slots__ = ('floor', 'cells')
+
+    def __init__(self, floor):
+        self.floor = floor
+        self.cells = {p for p in floor.discovered if self._is_frontier(p)}
+
+    def _is_frontier(self, pos):
+        f = self.floor
+        x, y = pos
+        if pos not in f.discovered or not f.is_floor(x, y):
+            return False
+        disc, W1, H1 = f.discovered, f.w - 1, f.h - 1
+        return any(0 < nx < W1 and 0 < ny < H1 and (nx, ny) not in disc
+                   for nx, ny in ((x+1, y), (x-1, y), (x, y+1), (x, y-1)))
+
+    def update(self, cells):
+        touched = set()
+        for x, y in cells:
+            touched.update(((x, y), (x+1, y), (x-1, y), (x, y+1), (x, y-1)))
+        for p in touched:
+            if self._is_frontier(p):
+                self.cells.add(p)
+            else:
+                self.cells.discard(p)
+
+    def path_from(self, start, avoid=()):
+        """Chemin (BFS sur le sol découvert, hors avoid) vers la case de frontière la plus proche; [] si aucune."""
+        f = self.floor
+        disc = f.discovered
+        prev = {start: None}
+        queue = deque([start])
+        while queue:
+            cur = queue.popleft()
+            if cur in self.cells and cur != start:
+                path = []
+                while cur != start:
+                    path.append(cur)
+                    cur = prev[cur]
+                path.reverse()
+                return path
+            x, y = cur
+            for nxt in ((x+1, y), (x-1, y), (x, y+1), (x, y-1)):
+                if nxt not in prev and nxt in disc and f.is_floor(*nxt) and nxt not in avoid:
+                    prev[nxt] = cur
+                    queue.append(nxt)
+        return []
 
 # ========================== RENDU & FOG ==========================
 def box_sprite(sprite_lines):
@@ -4273,201 +5509,295 @@ def box_sprite(sprite_lines):
     body = [c('│', Ansi.BRIGHT_WHITE) + _pad_ansi_right(line, w) + c('│', Ansi.BRIGHT_WHITE) for line in sprite_lines]
     return [top] + body + [bot]
 
+# Champ de vision en losange: décalages calculés une fois par rayon (bonus de vision compris),
+# et bords entrant/sortant par pas d'une case.
+_FOV_OFFSETS = {}
+_FOV_EDGES = {}
+
+def fov_offsets(radius):
+    """Décalages (dx, dy) du losange |dx|+|dy| <= radius."""
+    offs = _FOV_OFFSETS.get(radius)
+    if offs is None:
+        offs = _FOV_OFFSETS[radius] = tuple((dx, dy) for dy in range(-radius, radius+1)
+                                            for dx in range(abs(dy) - radius, radius - abs(dy) + 1))
+    return offs
+
+def fov_edges(radius, step):
+    """(entrants, sortants) d'un pas step: décalages depuis la nouvelle, resp. l'ancienne position."""
+    key = (radius, step)
+    edges = _FOV_EDGES.get(key)
+    if edges is None:
+        sx, sy = step
+        diamond = set(fov_offsets(radius))
+        entering = tuple((dx, dy) for dx, dy in fov_offsets(radius) if (dx + sx, dy + sy) not in diamond)
+        leaving = tuple((dx, dy) for dx, dy in fov_offsets(radius) if (dx - sx, dy - sy) not in diamond)
+        edges = _FOV_EDGES[key] = (entering, leaving)
+    return edges
+
+# Ombre portée symétrique (Albert Ford): chaque quadrant est balayé rangée par rangée dans son
+# repère (profondeur, colonne); la transformation vers (x, y) est précalculée par quadrant.
+# Pentes en fractions entières (numérateur, dénominateur > 0) pour rester exact sans Fraction.
+_QUADRANTS = (  # (dx, dy) par profondeur, (dx, dy) par colonne: nord, sud, est, ouest
+    (0, -1, 1, 0), (0, 1, 1, 0), (1, 0, 0, 1), (-1, 0, 0, 1),
+)
+
+def shadowcast(tiles, w, h, origin, radius):
+    """
+    Cases visibles depuis origin sur la grille de tuiles (les murs sont opaques, hors carte aussi),
+    bornées au losange |dx|+|dy| <= radius et à l'intérieur du cadre. Vision symétrique:
+    a voit b si et seulement si b voit a. Retourne un ensemble d'indices y*w + x.
+    """
+    ox, oy = origin
+    seen = {oy * w + ox}
+    for rx, ry, cx, cy in _QUADRANTS:
+        rows = [(1, -1, 1, 1, 1)]  # (profondeur, pente de début, pente de fin)
+        while rows:
+            depth, sn, sd, en, ed = rows.pop()
+            if depth > radius:
+                continue
+            lo = (2*depth*sn + sd) // (2*sd)        # arrondi, égalité vers le haut
+            hi = -((ed - 2*depth*en) // (2*ed))     # arrondi, égalité vers le bas
+            prev = None  # None, True (mur) ou False (sol) pour la case précédente de la rangée
+            bx, by = ox + depth*rx, oy + depth*ry
+            for col in range(lo, hi + 1):
+                x, y = bx + col*cx, by + col*cy
+                wall = not (0 <= x < w and 0 <= y < h) or tiles[y*w + x] == TILE_WALL
+                if (wall or (col*sd >= depth*sn and col*ed <= depth*en)) and depth + abs(col) <= radius \
+                        and 0 < x < w-1 and 0 < y < h-1:
+                    seen.add(y*w + x)
+                if prev is True and not wall:
+                    sn, sd = 2*col - 1, 2*depth
+                elif prev is False and wall:
+                    rows.append((depth + 1, sn, sd, 2*col - 1, 2*depth))
+                prev = wall
+            if prev is False:
+                rows.append((depth + 1, sn, sd, en, ed))
+    return seen
+
 def _visible_cells(floor: Floor, player_pos, radius=8):
+    # Ensemble de tuples (tests, benchs); update_fov tient le bitset floor.visible.
     px,py = player_pos
-    vis=set()
-    for y in range(max(1,py-radius), min(MAP_H-1, py+radius+1)):
-        for x in range(max(1,px-radius), min(MAP_W-1, px+radius+1)):
-            if abs(x-px)+abs(y-py) <= radius:
-                vis.add((x,y))
-    return vis
+    W1, H1 = floor.w - 1, floor.h - 1
+    return {(px+dx, py+dy) for dx, dy in fov_offsets(radius) if 0 < px+dx < W1 and 0 < py+dy < H1}
+
+def update_fov(floor, player_pos, radius):
+    """
+    Met à jour les bitsets floor.visible et floor.discovered depuis player_pos; retourne les cases
+    nouvellement visibles. Avec FOV_LINE_OF_SIGHT, ombre portée (Floor.line_of_sight, en cache).
+    Sinon losange plein: après un pas d'une case au même rayon, seuls ses bords entrant et sortant
+    sont touchés; à l'arrivée, après téléportation ou changement de rayon il est reconstruit.
+    """
+    prev = floor._fov_at
+    if prev == (player_pos, radius):
+        return set()
+    px, py = player_pos
+    if FOV_LINE_OF_SIGHT:
+        W = floor.w
+        visible = CellBits(W, floor.h)
+        bits, old = visible.bits, floor.visible.bits
+        new = set()
+        for k in floor.line_of_sight(player_pos, radius):
+            b, m = k >> 3, 1 << (k & 7)
+            bits[b] |= m
+            if not old[b] & m:
+                new.add((k % W, k // W))
+        floor.visible = visible
+        floor.discovered |= visible
+    elif prev is not None and prev[1] == radius and abs(px - prev[0][0]) + abs(py - prev[0][1]) == 1:
+        ox, oy = prev[0]
+        entering, leaving = fov_edges(radius, (px - ox, py - oy))
+        visible = floor.visible
+        for dx, dy in leaving:
+            visible.discard((ox + dx, oy + dy))
+        W1, H1 = floor.w - 1, floor.h - 1
+        new = {(px+dx, py+dy) for dx, dy in entering if 0 < px+dx < W1 and 0 < py+dy < H1}
+        visible |= new
+        floor.discovered |= new
+    else:
+        new = _visible_cells(floor, player_pos, radius)
+        floor.visible = CellBits(floor.w, floor.h)
+        floor.visible |= new
+        floor.discovered |= floor.visible
+    floor._fov_at = (player_pos, radius)
+    return new
 
 # Alias compat si du code appelle visible_cells()
 visible_cells = _visible_cells
 
+POI_HINTS = {
+    'up': "Escalier montant détecté — appuyez sur E.",
+    'down': "Escalier descendant détecté — appuyez sur E.",
+    'shop': "Marchand présent — appuyez sur E.",
+    'casino': "Casino présent — appuyez sur E.",
+    'altar': "Sanctuaire présent — appuyez sur E.",
+    'npc': "PNJ présent — appuyez sur E.",
+    'sage': "Le Sorcier vous attend — appuyez sur E.",
+}
+
 def interaction_hint(floor, player_pos):
     x, y = player_pos
-    pos = (x, y)
-    if floor.up and pos == floor.up and floor.depth > 0:
-        return "Escalier montant détecté — appuyez sur E."
-    if pos == floor.down:
-        return "Escalier descendant détecté — appuyez sur E."
-    if pos in getattr(floor, 'shops', set()):
-        return "Marchand présent — appuyez sur E."
-    if pos in getattr(floor, 'casinos', set()):
-        return "Casino présent — appuyez sur E."
-    if pos in getattr(floor, 'altars', set()):
-        return "Sanctuaire présent — appuyez sur E."
-    if pos in getattr(floor, 'npcs', {}):
-        return "PNJ présent — appuyez sur E."
-    if pos in getattr(floor, 'sages', set()):
-        return "Le Sorcier vous attend — appuyez sur E."
+    hint = POI_HINTS.get(floor.poi_kind(player_pos))
+    if hint:
+        return hint
     # Hint contextuel pour les portes verrouillées adjacentes.
     for dx, dy in ((1,0), (-1,0), (0,1), (0,-1)):
         door_pos = (x + dx, y + dy)
-        dtype = getattr(floor, 'locked_doors', {}).get(door_pos)
+        dtype = floor.locked_doors.get(door_pos)
         if dtype == 'boss':
             return "Porte de boss à proximité — nécessite une clé de boss."
         if dtype == 'normal':
             return "Porte verrouillée à proximité — nécessite une clé normale."
     return None
 
+# Glyphes stylés par thème: construits une fois, pas un c() par cellule et par frame.
+_GLYPH_ATLAS = {}
+
+def glyph_atlas(T) -> dict:
+    """Atlas {type de case: glyphe stylé} du thème T pour le mode couleur courant."""
+    key = (T['name'], SUPPORTS_ANSI, USE_TRUECOLOR)
+    atlas = _GLYPH_ATLAS.get(key)
+    if atlas is None:
+        atlas = {
+            'floor': c(FLOOR, T['floor']),
+            'wall': c(WALL, T['wall']),
+            'up': c(STAIR_UP, T['up']),
+            'down': c(STAIR_DOWN, T['down']),
+            'shop': c(SHOP_ICON, T['shop']),
+            'npc': c(NPC_ICON, T['npc']),
+            'sage': c(SAGE_ICON, Ansi.BRIGHT_BLUE),
+            'treasure': c(TREASURE_ICON, T['item']),
+            'boss_treasure': c(TREASURE_BOSS_ICON, T['elite']),
+            'altar': c(ALTAR_ICON, T.get('down', Ansi.BRIGHT_MAGENTA)),
+            'casino': c(CASINO_ICON, T.get('shop', Ansi.BRIGHT_YELLOW)),
+            'elite': c(ELITE_ICON, T['elite']),
+            'door': c(LOCKED_DOOR_ICON, T['shop']),
+            'player': c(PLAYER_ICON, T['player']),
+        }
+        _GLYPH_ATLAS[key] = atlas
+    return atlas
+
+MAP_CHROME_ROWS = 5  # lignes hors carte et hors HUD: entête (3), bas de cadre, message affiché sous la carte
+
+def hud_rows(lines, cols):
+    """Lignes physiques occupées par ces lignes de texte une fois enroulées à cols colonnes."""
+    return sum(max(1, -(-visible_len(line) // cols)) for line in lines)
+
+def map_viewport(floor, player_pos, side_w=0, term=None, hud=3):
+    """
+    Fenêtre (x0, y0, largeur, hauteur) de la carte affichée, centrée sur le joueur et bornée
+    à l'étage. Taillée au terminal, une fois retirées les lignes physiques du HUD (hud) et du
+    cadre; jamais plus petite que MAP_W x MAP_H.
+    """
+    cols, rows = term or shutil.get_terminal_size((200, 50))
+    vw = min(floor.w, max(MAP_W, cols - 2 - side_w))
+    vh = min(floor.h, max(MAP_H, rows - MAP_CHROME_ROWS - hud))
+    px, py = player_pos
+    x0 = max(0, min(px - vw // 2, floor.w - vw))
+    y0 = max(0, min(py - vh // 2, floor.h - vh))
+    return x0, y0, vw, vh
+
+def _fov_radius(player):
+    return int(8 + player.all_specials().get('fov_bonus', 0))
+
 def render_map(floor, player_pos, player):
     global MAP_FRAME_ACTIVE
-    # maj visibilité
-    base_radius = 8
-    bonus = player.all_specials().get('fov_bonus', 0)
-    visible = _visible_cells(floor, player_pos, radius=base_radius + bonus)
-    floor.visible = visible
-    floor.discovered |= visible
-
-    # mémoriser les POIs vus pour rester visibles ensuite
-    if floor.up and floor.up in visible:
-        floor.seen_stairs.add(floor.up)
-    if floor.down in visible:
-        floor.seen_stairs.add(floor.down)
-    for p in floor.shops:
-        if p in visible:
-            floor.seen_shops.add(p)
-    for p in floor.npcs.keys():
-        if p in visible:
-            floor.seen_npcs.add(p)
-    for p in getattr(floor, 'treasures', set()):
-        if p in visible:
-            floor.seen_treasures.add(p)
-    for p in getattr(floor, 'altars', set()):
-        if p in visible:
-            floor.seen_altars.add(p)
-    for p in getattr(floor, 'casinos', set()):
-        if p in visible:
-            floor.seen_casinos.add(p)
-    for p in getattr(floor, 'sages', set()):
-        if p in visible:
-            floor.seen_sages.add(p)
-
-    # entête et bordures
-    T = floor.theme
-    if MAP_FRAME_ACTIVE:
-        begin_frame_redraw()
-    else:
-        clear_screen()
-    border_left = c('│', T['border'])
-    border_right = c('│', T['border'])
-    print(c('┌' + '─' * MAP_W + '┐', T['border']))
-    title = f" Donjon — Étage {floor.depth} "
-    pad = max(0, MAP_W - len(title))
-    print(border_left + c(title + ' ' * pad, T['title']) + border_right)
-    print(c('├' + '─' * MAP_W + '┤', T['border']))
+    # maj visibilité; mémoriser les POIs vus pour rester visibles ensuite
+    floor.mark_seen(update_fov(floor, player_pos, _fov_radius(player)))
+    visible = floor.visible
+    seen = floor.seen
 
     # pré-calcul sprite latéral (évite de recalculer chaque ligne)
     side_lines = []
     side_blank = ""
-    top_off = 0
+    spr_w = 0
     if SHOW_SIDE_SPRITE:
-        spr = player.sprite if getattr(player, 'sprite', None) else SPRITES.get('knight', [])
-        spr_colored = colorize_sprite_by_hp(spr, player.hp, player.max_hp)
-        summon = _active_summon(player)
-        if summon and int(summon.get('hp', 0)) > 0:
-            s_spr = summon.get('map_sprite') or summon.get('sprite', [])
-            if bool(summon.get('use_hp_tint', True)):
-                s_col = colorize_sprite_by_hp(s_spr, int(summon.get('hp', 1)), int(summon.get('max_hp', 1)))
-            else:
-                s_col = s_spr[:]
-            h_side = max(len(spr_colored), len(s_col))
-            p_w = max((visible_len(x) for x in spr_colored), default=0)
-            s_w = max((visible_len(x) for x in s_col), default=0)
-            for i in range(h_side):
-                pl = spr_colored[i] if i < len(spr_colored) else (" " * p_w)
-                sl = s_col[i] if i < len(s_col) else (" " * s_w)
-                side_lines.append(_pad_ansi_right(pl, p_w) + "  " + _pad_ansi_right(sl, s_w))
-        else:
-            p_w = max((visible_len(x) for x in spr_colored), default=0)
-            side_lines = [_pad_ansi_right(line, p_w) for line in spr_colored]
-        spr_h = len(side_lines)
-        spr_w = max((visible_len(x) for x in side_lines), default=0)
-        top_off = max(0, (MAP_H - spr_h) // 2)
+        side_lines, spr_w = _side_panel(player)
         side_blank = '  ' + (' ' * spr_w)
+    # HUD sous la carte, construit d'abord: sa hauteur réelle (lignes enroulées comprises)
+    # est retirée de la fenêtre, sinon l'écran défile et les positions du diff se décalent.
+    hud = [c(HUD_CONTROLS, Ansi.BRIGHT_BLACK), player.stats_summary()]
+    hint = interaction_hint(floor, player_pos)
+    if hint:
+        hud.append(c(hint, Ansi.BRIGHT_YELLOW))
+    if SHOW_FRAME_STATS:
+        st = FRAME.stats()
+        hud.append(c(f"frame #{st['frames']}: {st['last_bytes']} o (moy. {st['avg_bytes']} o)  "
+                     f"envoi {st['last_flush_ms']:.2f} ms (max {st['max_flush_ms']:.2f} ms)", Ansi.BRIGHT_BLACK))
+    term = shutil.get_terminal_size((200, 50))
+    hud_h = hud_rows(hud, term[0]) + (0 if hint else 1)  # ligne d'indice réservée: hauteur stable
+    # Caméra: seule la fenêtre autour du joueur est dessinée (étages plus grands que l'écran).
+    x0, y0, vw, vh = map_viewport(floor, player_pos, side_w=len(side_blank), term=term, hud=hud_h)
+    top_off = max(0, (vh - len(side_lines)) // 2)
+
+    # entête et bordures
+    T = floor.theme
+    lines = []
+    border_left = c('│', T['border'])
+    border_right = c('│', T['border'])
+    lines.append(c('┌' + '─' * vw + '┐', T['border']))
+    title = f" Donjon — Étage {floor.depth} "
+    if (vw, vh) != (floor.w, floor.h):
+        title += f"({floor.w}x{floor.h}) "
+    pad = max(0, vw - len(title))
+    lines.append(border_left + c(title[:vw] + ' ' * pad, T['title']) + border_right)
+    lines.append(c('├' + '─' * vw + '┤', T['border']))
 
     # cache local pour réduire les lookups en boucle
-    discovered = floor.discovered
-    grid = floor.grid
-    up = floor.up
-    down = floor.down
-    seen_stairs = floor.seen_stairs
-    shops = floor.shops
-    seen_shops = floor.seen_shops
-    npcs = floor.npcs
-    seen_npcs = floor.seen_npcs
-    treasures = getattr(floor, 'treasures', set())
-    boss_treasures = getattr(floor, 'boss_treasures', set())
-    seen_treasures = floor.seen_treasures
-    altars = getattr(floor, 'altars', set())
-    seen_altars = floor.seen_altars
-    casinos = getattr(floor, 'casinos', set())
-    seen_casinos = floor.seen_casinos
-    sages = getattr(floor, 'sages', set())
-    seen_sages = floor.seen_sages
-    elites = getattr(floor, 'elites', set())
-    locked_doors = getattr(floor, 'locked_doors', {})
-    floor_dot = c('·', T['floor'])
-    wall_hash = c('#', T['wall'])
+    # bitsets lus par indice de case (bit k = y*w + x)
+    disc_bits = floor.discovered.bits
+    vis_bits = visible.bits
+    seen_bits = seen.bits
+    tiles = floor.tiles
+    overlay = floor.overlay
+    # POI affiché hors champ de vision s'il a déjà été vu; élites et portes dès que la case est découverte
+    always_shown = (POI_CODES['elite'], POI_CODES['door'])
+    G = glyph_atlas(T)
+    poi_glyphs = [None] + [G[kind] for kind in POI_KINDS[1:]]  # glyphe par code du calque
+    floor_dot = G['floor']
+    wall_hash = G['wall']
+    p_icon = getattr(player, 'map_icon', PLAYER_ICON) or PLAYER_ICON
+    p_glyph = G['player'] if p_icon == PLAYER_ICON else c(p_icon, T['player'])
 
     px, py = player_pos
-    for y in range(MAP_H):
+    fw = floor.w
+    for y in range(y0, y0 + vh):
         row_parts = []
-        for x in range(MAP_W):
-            pos = (x, y)
-            is_vis = pos in visible
-            is_disc = pos in discovered
-            if not is_disc:
+        base = y * fw
+        for x in range(x0, x0 + vw):
+            k = base + x
+            byte, bit = k >> 3, 1 << (k & 7)
+            if not disc_bits[byte] & bit:
                 row_parts.append(' ')
                 continue
+            is_vis = vis_bits[byte] & bit
             if x == px and y == py and is_vis:
-                p_icon = getattr(player, 'map_icon', PLAYER_ICON) or PLAYER_ICON
-                row_parts.append(c(p_icon, T['player']))
-            elif up and pos == up and (is_vis or pos in seen_stairs):
-                row_parts.append(c(STAIR_UP, T['up']))
-            elif pos == down and (is_vis or pos in seen_stairs):
-                row_parts.append(c(STAIR_DOWN, T['down']))
-            elif pos in shops and (is_vis or pos in seen_shops):
-                row_parts.append(c(SHOP_ICON, T['shop']))
-            elif pos in npcs and (is_vis or pos in seen_npcs):
-                row_parts.append(c(NPC_ICON, T['npc']))
-            elif pos in sages and (is_vis or pos in seen_sages):
-                row_parts.append(c(SAGE_ICON, Ansi.BRIGHT_BLUE))
-            elif pos in treasures and (is_vis or pos in seen_treasures):
-                if pos in boss_treasures:
-                    row_parts.append(c(TREASURE_BOSS_ICON, T['elite']))
-                else:
-                    row_parts.append(c(TREASURE_ICON, T['item']))
-            elif pos in altars and (is_vis or pos in seen_altars):
-                row_parts.append(c(ALTAR_ICON, T.get('down', Ansi.BRIGHT_MAGENTA)))
-            elif pos in casinos and (is_vis or pos in seen_casinos):
-                row_parts.append(c(CASINO_ICON, T.get('shop', Ansi.BRIGHT_YELLOW)))
-            elif pos in elites:
-                row_parts.append(c(ELITE_ICON, T['elite']))
-            elif pos in locked_doors and (is_vis or is_disc):
-                row_parts.append(c(LOCKED_DOOR_ICON, T['shop']))
-            else:
-                row_parts.append(floor_dot if grid[y][x] == FLOOR else wall_hash)
+                row_parts.append(p_glyph)
+                continue
+            code = overlay[k]
+            if code:
+                if is_vis or seen_bits[byte] & bit or code in always_shown:
+                    row_parts.append(poi_glyphs[code])
+                    continue
+            row_parts.append(floor_dot if tiles[k] == TILE_FLOOR else wall_hash)
 
         side = ''
         if SHOW_SIDE_SPRITE:
-            if top_off <= y < top_off + len(side_lines):
-                side = '  ' + side_lines[y - top_off]
+            if top_off <= y - y0 < top_off + len(side_lines):
+                side = '  ' + side_lines[y - y0 - top_off]
             else:
                 side = side_blank
-        print(border_left + ''.join(row_parts) + border_right + side)
-    print(c('└' + '─' * MAP_W + '┘', T['border']))
-    print(c(HUD_CONTROLS, Ansi.BRIGHT_BLACK))
-    print(player.stats_summary())
-    hint = interaction_hint(floor, player_pos)
-    if hint:
-        print(c(hint, Ansi.BRIGHT_YELLOW))
-    if SUPPORTS_ANSI:
-        # Nettoie les éventuels résidus d'une frame précédente plus grande.
-        sys.stdout.write("\x1b[J")
-        sys.stdout.flush()
+        lines.append(border_left + ''.join(row_parts) + border_right + side)
+    lines.append(c('└' + '─' * vw + '┘', T['border']))
+    lines.extend(hud)
+    with FRAME:
+        if not MAP_FRAME_ACTIVE or not SUPPORTS_ANSI:
+            clear_screen()
+            MAP_SCREEN.invalidate()
+        if SUPPORTS_ANSI:
+            # Repaint map->map: seules les cellules modifiées depuis la frame précédente partent.
+            FRAME.write(MAP_SCREEN.diff(lines))
+        else:
+            emit('\n'.join(lines))
     MAP_FRAME_ACTIVE = True
 
 # ========================== COFFRE ==========================
@@ -4527,7 +5857,7 @@ def open_treasure_choice(player, depth, chest_type='normal'):
             chest_title = 'Coffre de boss !' if chest_type == 'boss' else 'Trésor !'
             draw_box(chest_title, rows, width=max(140, MAP_W + 24))
 
-            cmd = input('> ').strip().lower()
+            cmd = read_line('> ').strip().lower()
             if cmd in ('q',''):
                 base_xp = 2 + depth + (2 if chest_type == 'boss' else 0)
                 rarity_bonus = int(round(rarity_score * (1.15 if chest_type == 'boss' else 1.0)))
@@ -4629,7 +5959,7 @@ def open_shop(player, depth):
                 seller_rows.append(line)
         seller_rows.append('')
         if not stock:
-            seller_rows.append(c('(Rupture de stock)', Ansi.BRIGHT_BLACK))
+            seller_rows.append(StyledText.of('(Rupture de stock)', Ansi.BRIGHT_BLACK))
         else:
             for i, it in enumerate(stock, 1):
                 price = price_of(it)
@@ -4639,10 +5969,10 @@ def open_shop(player, depth):
                 else:
                     label = item_brief_stats(it)
                     if str(getattr(it, 'effect', '')).startswith('frag_'):
-                        label = c(label, consumable_display_color(it))
-                    seller_rows.append(f"{i:>2}) {label}  — {price} or")
+                        label = StyledText.from_ansi(c(label, consumable_display_color(it)))
+                    seller_rows.append(f"{i:>2}) " + label + f"  — {price} or")
         seller_rows.append('')
-        seller_rows.append(c("Commandes :", Ansi.BRIGHT_WHITE))
+        seller_rows.append(StyledText.of("Commandes :", Ansi.BRIGHT_WHITE))
         seller_rows.append(" - <num> : acheter l’item du vendeur")
         seller_rows.append(f" - k : acheter 1 clé normale ({normal_key_price} or) [stock: {normal_key_stock}]")
         if shop_spell_sid:
@@ -4657,33 +5987,34 @@ def open_shop(player, depth):
 
         # ==== SECTION JOUEUR (ventes) ====
         player_rows = []
-        player_rows.append(c('Vos objets vendables', Ansi.BRIGHT_MAGENTA))
+        player_rows.append(StyledText.of('Vos objets vendables', Ansi.BRIGHT_MAGENTA))
         if not player.inventory:
-            player_rows.append(c('(Aucun objet vendable dans l’inventaire)', Ansi.BRIGHT_BLACK))
+            player_rows.append(StyledText.of('(Aucun objet vendable dans l’inventaire)', Ansi.BRIGHT_BLACK))
         else:
             for i, pit in enumerate(player.inventory, 1):
                 val = max(5, price_of(pit)//2)
-                player_rows.append(f"{i:>2}) {item_summary(pit)}  — vend: {val} or")
+                player_rows.append(f"{i:>2}) " + item_summary(pit) + f"  — vend: {val} or")
 
         # (Optionnel) Afficher vos consommables en lecture seule
         if getattr(player, 'consumables', None):
             player_rows.append('')
-            player_rows.append(c('Vos consommables (non vendables)', Ansi.BRIGHT_CYAN))
+            player_rows.append(StyledText.of('Vos consommables (non vendables)', Ansi.BRIGHT_CYAN))
             cons = _consumable_stacks(player)
             if not cons:
-                player_rows.append(c('(Vide)', Ansi.BRIGHT_BLACK))
+                player_rows.append(StyledText.of('(Vide)', Ansi.BRIGHT_BLACK))
             else:
                 for st in cons:
-                    player_rows.append(f" • {item_summary(st['item'])} x{st['qty']}")
+                    player_rows.append(" • " + item_summary(st['item']) + f" x{st['qty']}")
 
         # ==== Rendu : deux boîtes l’une sous l’autre ====
-        clear_screen()
-        draw_box(f"Vendeur (Étage {depth})", seller_rows, width=BOX_W)
-        print()  # petite marge visuelle
-        draw_box("Vos objets (vendre: v<num>/va  •  détails: s<num>)", player_rows, width=BOX_W)
+        with FRAME:
+            clear_screen()
+            draw_box(f"Vendeur (Étage {depth})", seller_rows, width=BOX_W)
+            emit()  # petite marge visuelle
+            draw_box("Vos objets (vendre: v<num>/va  •  détails: s<num>)", player_rows, width=BOX_W)
 
         # ==== Commandes ====
-        cmd = input('> ').strip().lower()
+        cmd = read_line('> ').strip().lower()
         if cmd == 'q':
             break
         if cmd == 'k':
@@ -4785,7 +6116,7 @@ def title_menu():
     lines.append("But : descendre les étages, survivre et devenir surpuissant grâce au loot.")
     lines.append("Fonctionnalités : quêtes PNJ, marchand, casino, autels, salles verrouillées, Sorcier & grimoire.")
     lines.append(MENU_CONTROLS)
-    lines.append("Astuce : entre un nombre + direction (ex: 5d) ou '.' pour répéter le dernier pas.")
+    lines.append(f"Astuce : entre {MOVE_COUNT_PREFIX}5d pour avancer de 5 cases ou '.' pour répéter le dernier pas.")
     clear_screen(); draw_box('ROGMINAL — Menu', lines, width=100); pause("Appuyez sur Entrée pour jouer...")
 
 # ========================== ÉVÉNEMENTS ==========================
@@ -4838,7 +6169,7 @@ def ask_restart_after_death():
         "Relancer une nouvelle partie ? (o/n)"
     ], width=62)
     while True:
-        cmd = input("> ").strip().lower()
+        cmd = read_line("> ").strip().lower()
         if cmd in ("o", "y"):
             return True
         if cmd in ("n", "q", "x", ""):
@@ -4855,7 +6186,7 @@ def choose_player_class():
     ]
     draw_box("Classe", rows, width=96)
     while True:
-        cmd = input("> ").strip().lower()
+        cmd = read_line("> ").strip().lower()
         if cmd in ("", "1", "c", "chevalier"):
             return "Chevalier"
         if cmd in ("2", "m", "mage"):
@@ -4867,6 +6198,13 @@ def game_loop():
     enable_windows_ansi()
     if '--test' in sys.argv:
         run_tests(); return 'tests_ok'
+    if '--bench' in sys.argv:
+        run_benchmarks(); return 'bench_ok'
+    # Une seule session clavier pour toute la partie (terminal restauré en sortie).
+    with TerminalSession():
+        return _run_game()
+
+def _run_game():
     title_menu()
     chosen_class = choose_player_class()
     player=Player('Héros', klass=chosen_class)
@@ -4875,11 +6213,281 @@ def game_loop():
         player.spell_scrolls = [sp.sid for sp in SPELLS]
         draw_box("Debug", ["Mode debug activé: tous les sorts ont été ajoutés au grimoire."], width=92)
         time.sleep(0.8)
-    floors=[Floor(0)]; cur=0; pos=floors[0].start
+    # Étages suivants préparés en arrière-plan (graine de partie + graine par étage).
+    prefetch = FloorPrefetcher(random.getrandbits(64))
+    try:
+        return _explore(player, prefetch)
+    finally:
+        prefetch.close()
+
+def _move_step(player, f, pos, dx, dy):
+    """
+    Un pas dans la direction (dx, dy): combat d'élite, événements, rencontres, objets, trésors,
+    ouverture de porte verrouillée. Retourne (position, 'moved' | 'blocked' | 'dead').
+    """
+    nx, ny = pos[0] + dx, pos[1] + dy
+    if f.is_floor(nx, ny):
+        pos = (nx, ny)
+        player.last_move = (dx, dy)
+
+        # Boss sur la case actuelle ? Prioritaire sur les rencontres normales.
+        if pos in f.elites:
+            status, _ = _normalize_fight_result(fight(player, f.depth, boss=True))
+            if status == 'dead':
+                return pos, 'dead'
+            if status == 'win':
+                f.clear_elite(pos)  # boss vaincu
+            if status == 'fled':
+                return pos, 'moved'
+
+        # Événements / Rencontres
+        ev = maybe_trigger_event(player, f.depth)
+        meet = (ev == 'fight') or (pos in f.monsters and random.random() < (0.30 + 0.02*f.depth))
+        if meet:
+            status, kill_id = _normalize_fight_result(fight(player, f.depth))
+            if status == 'dead':
+                return pos, 'dead'
+
+            if status != 'fled':
+                f.remove_monster(pos)
+
+            _apply_combat_quest_progress(player, status, kill_id)
+
+        # Ramassage d'ITEMS (indépendant des trésors)
+        if pos in f.items:
+            it = random_item(f.depth, player) if random.random() < 0.65 else random_consumable(f.depth, source='loot')
+            msg = 'Vous trouvez: ' + item_summary(it)
+            if isinstance(it, Consumable):
+                if _add_consumable(player, it, qty=1) > 0:
+                    lines = [msg, "Ajouté aux consommables."]
+                else:
+                    lines = [msg, "Sac de consommables plein."]
+            else:
+                if len(player.inventory) < player.inventory_limit:
+                    player.inventory.append(it)
+                    lines = [msg, "Ajouté à l'inventaire."]
+                else:
+                    lines = [msg, "Inventaire plein."]
+
+            # Ces trois lignes doivent être hors des branches conso/objet
+            draw_box('Trouvaille', lines, width=84)
+            maybe_autocomplete_quests(player)
+            f.take_item(pos)
+            time.sleep(0.4)
+
+        # Trésors (⚠️ en-dehors du bloc items !)
+        if hasattr(f, 'treasures') and pos in f.treasures:
+            chest_type = getattr(f, 'treasure_types', {}).get(pos, 'normal')
+            open_treasure_choice(player, f.depth, chest_type=chest_type)
+            f.open_treasure(pos)
+            # (optionnel) progression de quêtes "survive" après un choix :
+            maybe_autocomplete_quests(player)
+        return pos, 'moved'
+    else:
+        # Porte verrouillée : ouverture avec la bonne clé.
+        door_type = getattr(f, 'locked_doors', {}).get((nx, ny))
+        if door_type:
+            if door_type == 'boss':
+                if player.boss_keys <= 0:
+                    draw_box("Porte verrouillée", ["Il faut une clé de boss pour ouvrir cette porte."], width=88)
+                    time.sleep(0.6)
+                    return pos, 'blocked'
+                player.boss_keys -= 1
+                door_label = "clé de boss"
+            else:
+                if player.normal_keys <= 0:
+                    draw_box("Porte verrouillée", ["Il faut une clé normale pour ouvrir cette porte."], width=88)
+                    time.sleep(0.6)
+                    return pos, 'blocked'
+                player.normal_keys -= 1
+                door_label = "clé normale"
+
+            f.unlock_door((nx, ny))
+            pos = (nx, ny)
+            draw_box("Porte ouverte", [f"Vous utilisez une {door_label}. La salle est accessible."], width=88)
+            time.sleep(0.5)
+            return pos, 'moved'
+    return pos, 'blocked'
+
+AUTO_WALK_STOPS = {
+    'explored': "Plus rien à explorer ici.",
+    'low_hp': "PV bas : exploration auto interrompue.",
+    'poi': "Quelque chose en vue.",
+    'blocked': "Chemin barré.",
+}
+
+def _walk_key_pressed():
+    # Marche automatique: une touche pressée l'interrompt et n'est pas rejouée ensuite.
+    if TERMINAL_SESSION is not None and TERMINAL_SESSION.read_key(0) is not None:
+        TERMINAL_SESSION.flush()
+        return True
+    return False
+
+def auto_explore(player, f, pos):
+    """
+    Exploration auto: marche vers la case de frontière joignable la plus proche, pas à pas via
+    _move_step. S'arrête sur popup (combat, objet, trésor, événement), POI en vue, PV bas, touche
+    pressée ou étage exploré. Rendu au plus AUTO_EXPLORE_FPS fois par seconde, et à l'arrêt.
+    Retourne (position, raison): 'explored' | 'poi' | 'low_hp' | 'event' | 'key' | 'steps' | 'dead'.
+    """
+    radius = _fov_radius(player)
+    f.mark_seen(update_fov(f, pos, radius))
+    frontier = Frontier(f)
+    path = []
+    frame_gap = 1.0 / max(1, AUTO_EXPLORE_FPS)
+    last_frame = time.perf_counter()
+    reason = 'steps'
+    for _ in range(AUTO_EXPLORE_MAX_STEPS):
+        if player.hp < player.max_hp * AUTO_EXPLORE_MIN_HP:
+            reason = 'low_hp'; break
+        # Le chemin n'est recalculé que si sa cible a quitté la frontière (les élites sont contournés).
+        if not path or path[-1] not in frontier.cells:
+            path = frontier.path_from(pos, avoid=f.elites)
+            if not path:
+                reason = 'explored'; break
+        nxt = path.pop(0)
+        framed = MAP_FRAME_ACTIVE
+        pos, status = _move_step(player, f, pos, nxt[0] - pos[0], nxt[1] - pos[1])
+        if status == 'dead':
+            return pos, 'dead'
+        if pos != nxt:
+            path = []
+        new = update_fov(f, pos, radius)
+        spotted = any(f.poi_kind(p) is not None and p not in f.seen for p in new)
+        f.mark_seen(new)
+        frontier.update(new)
+        if framed and not MAP_FRAME_ACTIVE:  # un draw_box a remplacé la carte
+            reason = 'event'; break
+        if spotted:
+            reason = 'poi'; break
+        if _walk_key_pressed():
+            reason = 'key'; break
+        now = time.perf_counter()
+        if now - last_frame >= frame_gap:
+            render_map(f, pos, player)
+            last_frame = now
+    render_map(f, pos, player)
+    return pos, reason
+
+TRAVEL_KINDS = {
+    'up': "Escalier montant", 'down': "Escalier descendant", 'shop': "Marchand",
+    'casino': "Casino", 'altar': "Sanctuaire", 'sage': "Sorcier", 'npc': "PNJ",
+}
+
+def travel_targets(f, pos):
+    """
+    [(distance, libellé, case)] des POIs déjà vus et joignables à pied, du plus proche au plus loin.
+    Marche non orientée à coût 1: le seul champ de distance de pos (hors cache) donne toutes
+    les distances.
+    """
+    spots = []
+    field, W = f.distance_field(pos, cache=False), f.w
+    for p in f.seen:
+        kind = f.poi_kind(p)
+        if kind in TRAVEL_KINDS and p != pos:
+            d = field[p[1] * W + p[0]]
+            if d > 0:
+                label = f.npcs[p]['name'] if kind == 'npc' else TRAVEL_KINDS[kind]
+                spots.append((d, label, p))
+    return sorted(spots)
+
+def choose_travel_target(f, pos):
+    """Case cible (tuple) ou None si annulation / aucune destination connue."""
+    spots = travel_targets(f, pos)
+    if not spots:
+        draw_box("Aller à", ["Aucune destination connue sur cet étage."], width=52)
+        time.sleep(0.6)
+        return None
+    lines = ["Choisissez votre destination :"]
+    for i, (d, label, _) in enumerate(spots, 1):
+        lines.append(f" {i}) {label} — {d} pas")
+    lines.append(" q) Annuler")
+    draw_box("Aller à", lines, width=60)
+    while True:
+        cmd = read_line("> ").strip().lower()
+        if cmd in ("q", "x", ""):
+            return None
+        if cmd.isdigit():
+            idx = int(cmd) - 1
+            if 0 <= idx < len(spots):
+                return spots[idx][2]
+        print("Choix invalide.")
+
+def _route(f, start, goal, avoid=()):
+    """Plus court chemin sur le sol (BFS, hors avoid) de start exclu à goal inclus; [] si aucun."""
+    prev = {start: None}
+    queue = deque([start])
+    while queue:
+        cur = queue.popleft()
+        if cur == goal:
+            path = []
+            while cur != start:
+                path.append(cur)
+                cur = prev[cur]
+            path.reverse()
+            return path
+        x, y = cur
+        for nxt in ((x+1, y), (x-1, y), (x, y+1), (x, y-1)):
+            if nxt not in prev and f.is_floor(*nxt) and nxt not in avoid:
+                prev[nxt] = cur
+                queue.append(nxt)
+    return []
+
+def travel_to(player, f, pos, target):
+    """
+    Voyage vers target: descente du champ de distance de la cible (en cache sur l'étage, vidé
+    seulement quand la grille change), pas à pas via _move_step. Si un élite occupe tous les
+    prochains pas les plus courts, le reste du trajet est re-planifié par BFS en le contournant.
+    S'arrête à l'arrivée, sur popup (combat, objet, événement), cible injoignable ou touche pressée.
+    La carte est rendue au départ (elle remplace le menu) puis une seule fois, à l'arrêt.
+    Retourne (position, raison): 'arrived' | 'event' | 'blocked' | 'key' | 'dead'.
+    """
+    field = f.distance_field(target)
+    radius = _fov_radius(player)
+    render_map(f, pos, player)
+    W = f.w
+    detour = []
+    reason = 'arrived'
+    while pos != target:
+        x, y = pos
+        if detour:
+            nxt = detour.pop(0)
+        else:
+            d = field[y * W + x]
+            nxt = next(((nx, ny) for nx, ny in ((x+1, y), (x-1, y), (x, y+1), (x, y-1))
+                        if f.is_floor(nx, ny) and field[ny * W + nx] == d - 1 and (nx, ny) not in f.elites), None)
+            if nxt is None and d > 0:
+                detour = _route(f, pos, target, avoid=f.elites)
+                nxt = detour.pop(0) if detour else None
+        if nxt is None:
+            reason = 'blocked'; break
+        framed = MAP_FRAME_ACTIVE
+        pos, status = _move_step(player, f, pos, nxt[0] - x, nxt[1] - y)
+        if status == 'dead':
+            return pos, 'dead'
+        f.mark_seen(update_fov(f, pos, radius))
+        if framed and not MAP_FRAME_ACTIVE:
+            reason = 'event'; break
+        if pos != nxt:
+            reason = 'blocked'; break
+        if _walk_key_pressed():
+            reason = 'key'; break
+    render_map(f, pos, player)
+    return pos, reason
+
+def _explore(player, prefetch):
+    floors = FloorStore(prefetch); cur=0; pos=floors[0].start
+    floors.prefetch_after(cur)
+    queued = None
     while True:
         f = floors[cur]
-        render_map(f, pos, player)
-        kind, payload = read_command(player.last_move)
+        if queued is None:
+            render_map(f, pos, player)
+            kind, payload = read_command(player.last_move)
+        else:
+            # Déplacement tapé d'avance: appliqué sans re-rendu intermédiaire.
+            kind, payload = queued
+            queued = None
         act = None  # Initialisation pour éviter UnboundLocalError
         if kind == 'action':
             act = payload
@@ -4902,26 +6510,45 @@ def game_loop():
             open_stats_interface(player); continue
         if act == 'm':
             pos = open_spellbook(player, f.depth, f, pos); continue
+        if act == 'o':
+            pos, why = auto_explore(player, f, pos)
+            if why == 'dead':
+                return 'dead'
+            if why in AUTO_WALK_STOPS:
+                print(AUTO_WALK_STOPS[why]); time.sleep(0.5)
+            continue
+        if act == 'g':
+            target = choose_travel_target(f, pos)
+            if target is not None:
+                pos, why = travel_to(player, f, pos, target)
+                if why == 'dead':
+                    return 'dead'
+                if why in AUTO_WALK_STOPS:
+                    print(AUTO_WALK_STOPS[why]); time.sleep(0.5)
+            continue
         if act == 'e':
-            if f.up and pos == f.up and cur > 0:
+            poi = f.poi(pos)
+            here = poi.kind if poi else None
+            if here == 'up' and cur > 0:
                 target = choose_floor_destination(cur, direction=-1)
                 if target is not None:
                     cur = target
                     f = floors[cur]
                     pos = f.down if f.down else f.start
+                    floors.prefetch_after(cur)
                     player.reset_floor_magic()
                     draw_box('Étage', [f"Vous remontez à l'étage {cur}."], width=44); time.sleep(0.5)
-            elif pos == f.down:
+            elif here == 'down':
                 target = choose_floor_destination(cur, direction=1)
                 if target is not None:
-                    while target >= len(floors):
-                        floors.append(Floor(len(floors)))
+                    # Les étages sautés ne sont pas générés (voir FloorStore).
                     cur = target
                     f = floors[cur]
                     pos = f.up if f.up else f.start
+                    floors.prefetch_after(cur)
                     player.reset_floor_magic()
                     draw_box('Étage', [f"Vous descendez à l'étage {cur}."], width=44); time.sleep(0.5)
-            elif pos in f.shops:
+            elif here == 'shop':
                 uses = player.shop_access_count.get(cur, 0)
                 if uses == 0:
                     open_shop(player, f.depth)
@@ -4931,7 +6558,7 @@ def game_loop():
                         draw_box('Boutique', ["Accès bonus: 10 or requis.", "Vous n'avez pas assez d'or."], width=72)
                         pause()
                     else:
-                        ask = input("Payer 10 or pour réutiliser la boutique une fois ? (o/n) ").strip().lower()
+                        ask = read_line("Payer 10 or pour réutiliser la boutique une fois ? (o/n) ").strip().lower()
                         if ask in ('o', 'y'):
                             player.gold -= 10
                             open_shop(player, f.depth)
@@ -4939,8 +6566,8 @@ def game_loop():
                 else:
                     draw_box('Boutique', [f"Boutique de l'étage {cur} épuisée (accès bonus déjà utilisé)."], width=76)
                     pause()
-            elif pos in f.npcs:
-                npc=f.npcs[pos]; q=npc['quest']
+            elif here == 'npc':
+                npc=poi.state; q=npc['quest']
                 clear_screen(); draw_box(f"{npc['name']} (Étage {q.giver_floor})", [
                     (f"Tuer {q.amount} {q.target}(s)." if q.type=='slay' else
                      f"Ramène: {q.target}." if q.type=='fetch' else
@@ -4949,11 +6576,11 @@ def game_loop():
                 ], width=80)
                 existing = next((qq for qq in player.quests_active if qq.qid==q.qid), None)
                 if existing is None and all(qq.qid!=q.qid for qq in player.quests_done):
-                    if input('Accepter ? (o/n) ').strip().lower() in ('o','y'):
+                    if read_line('Accepter ? (o/n) ').strip().lower() in ('o','y'):
                         player.quests_active.append(q); draw_box('Quête', ['Quête acceptée !'], width=36); pause()
                 else:
                     draw_box('Quête', ['Rien à remettre pour le moment.'], width=40); pause()
-            elif pos in getattr(f, 'sages', set()):
+            elif here == 'sage':
                 if f.depth in player.sage_depths_visited:
                     draw_box("Sorcier", ["Le Sorcier se détourne.", "« Un seul parchemin par étage. »"], width=72)
                     pause()
@@ -4968,7 +6595,7 @@ def game_loop():
                             draw_box("Sorcier", [f"Reroll indisponible: {reroll_cost} or requis.", "Vous n'avez pas assez d'or."], width=82)
                             pause()
                         else:
-                            ask = input(f"Payer {reroll_cost} or pour un reroll unique du Sorcier ? (o/n) ").strip().lower()
+                            ask = read_line(f"Payer {reroll_cost} or pour un reroll unique du Sorcier ? (o/n) ").strip().lower()
                             if ask in ('o', 'y'):
                                 player.gold -= reroll_cost
                                 _picked = open_sage_spell_offer(player, f.depth)
@@ -4976,12 +6603,12 @@ def game_loop():
                     else:
                         draw_box("Sorcier", ["Le Sorcier reste silencieux.", "Reroll déjà consommé pour cet étage."], width=78)
                         pause()
-            elif pos in getattr(f, 'casinos', set()):
+            elif here == 'casino':
                 open_casino(player, f.depth)
-            elif pos in getattr(f, 'altars', set()):
+            elif here == 'altar':
                 used = open_altar(player, f.depth)
                 if used:
-                    f.altars.discard(pos)
+                    f.use_altar(pos)
             else:
                 print("Rien d'interactif ici."); time.sleep(0.5)
             continue
@@ -4989,93 +6616,17 @@ def game_loop():
         # Déplacements
         if kind == 'move':
             n, (dx,dy) = payload
+            interrupts_before = TERMINAL_SESSION.interrupts if TERMINAL_SESSION else 0
             for _ in range(max(1, n)):
-                nx, ny = pos[0] + dx, pos[1] + dy
-                if 0 <= nx < MAP_W and 0 <= ny < MAP_H and f.grid[ny][nx] != WALL:
-                    pos = (nx, ny)
-                    player.last_move = (dx, dy)
-
-                    # Boss sur la case actuelle ? Prioritaire sur les rencontres normales.
-                    if pos in f.elites:
-                        status, _ = _normalize_fight_result(fight(player, f.depth, boss=True))
-                        if status == 'dead':
-                            return 'dead'
-                        if status == 'win':
-                            f.elites.discard(pos)  # boss vaincu
-                        if status == 'fled':
-                            continue
-
-                    # Événements / Rencontres
-                    ev = maybe_trigger_event(player, f.depth)
-                    meet = (ev == 'fight') or (pos in f.monsters and random.random() < (0.30 + 0.02*f.depth))
-                    if meet:
-                        status, kill_id = _normalize_fight_result(fight(player, f.depth))
-                        if status == 'dead':
-                            return 'dead'
-
-                        if status != 'fled' and pos in f.monsters:
-                            f.monsters.discard(pos)
-
-                        _apply_combat_quest_progress(player, status, kill_id)
-
-                    # Ramassage d'ITEMS (indépendant des trésors)
-                    if pos in f.items:
-                        it = random_item(f.depth, player) if random.random() < 0.65 else random_consumable(f.depth, source='loot')
-                        msg = 'Vous trouvez: ' + item_summary(it)
-                        if isinstance(it, Consumable):
-                            if _add_consumable(player, it, qty=1) > 0:
-                                lines = [msg, "Ajouté aux consommables."]
-                            else:
-                                lines = [msg, "Sac de consommables plein."]
-                        else:
-                            if len(player.inventory) < player.inventory_limit:
-                                player.inventory.append(it)
-                                lines = [msg, "Ajouté à l'inventaire."]
-                            else:
-                                lines = [msg, "Inventaire plein."]
-
-                        # Ces trois lignes doivent être hors des branches conso/objet
-                        draw_box('Trouvaille', lines, width=84)
-                        maybe_autocomplete_quests(player)
-                        f.items.discard(pos)
-                        time.sleep(0.4)
-
-                    # Trésors (⚠️ en-dehors du bloc items !)
-                    if hasattr(f, 'treasures') and pos in f.treasures:
-                        chest_type = getattr(f, 'treasure_types', {}).get(pos, 'normal')
-                        open_treasure_choice(player, f.depth, chest_type=chest_type)
-                        if chest_type == 'boss':
-                            f.boss_treasures.discard(pos)
-                        f.treasure_types.pop(pos, None)
-                        f.treasures.discard(pos)
-                        # (optionnel) progression de quêtes "survive" après un choix :
-                        maybe_autocomplete_quests(player)
-                else:
-                    # Porte verrouillée : ouverture avec la bonne clé.
-                    door_type = getattr(f, 'locked_doors', {}).get((nx, ny))
-                    if door_type:
-                        if door_type == 'boss':
-                            if player.boss_keys <= 0:
-                                draw_box("Porte verrouillée", ["Il faut une clé de boss pour ouvrir cette porte."], width=88)
-                                time.sleep(0.6)
-                                break
-                            player.boss_keys -= 1
-                            door_label = "clé de boss"
-                        else:
-                            if player.normal_keys <= 0:
-                                draw_box("Porte verrouillée", ["Il faut une clé normale pour ouvrir cette porte."], width=88)
-                                time.sleep(0.6)
-                                break
-                            player.normal_keys -= 1
-                            door_label = "clé normale"
-
-                        f.locked_doors.pop((nx, ny), None)
-                        f.grid[ny][nx] = FLOOR
-                        pos = (nx, ny)
-                        draw_box("Porte ouverte", [f"Vous utilisez une {door_label}. La salle est accessible."], width=88)
-                        time.sleep(0.5)
-                        continue
+                pos, status = _move_step(player, f, pos, dx, dy)
+                if status == 'dead':
+                    return 'dead'
+                if status == 'blocked':
                     break
+            # Touche maintenue: on enchaîne les déplacements déjà en file et on ne rend qu'une frame,
+            # sauf si un événement bloquant (combat, popup) a vidé la file entre-temps.
+            if TERMINAL_SESSION is not None and TERMINAL_SESSION.interrupts == interrupts_before:
+                queued = poll_queued_move(player.last_move)
             continue
 
     return 'quit'
@@ -5094,14 +6645,92 @@ def _bfs_path_exists(grid, start, goal):
     return False
 
 def run_tests():
+    global SUPPORTS_ANSI, FOV_LINE_OF_SIGHT, SHOW_FRAME_STATS
     print('Tests: génération de carte & utilitaires...')
     f=Floor(1)
     assert f.grid[f.start[1]][f.start[0]]==FLOOR, 'Start doit être sur du sol'
     assert f.down is not None, 'Escalier bas manquant'
     assert _bfs_path_exists(f.grid, f.start, f.down), 'Chemin start→down requis'
+    # Connexité garantie à la génération: un POI emmuré est relié par un couloir
+    assert f.gen_stats['unreachable'] == 0 and f.gen_stats['repairs'] == 0, 'Étage généré non connexe'
+    # Poche isolée collée au pourtour d'une salle verrouillée, creusée avec les helpers de Floor
+    # (masques d'occupation cohérents); l'escalier y est déplacé puis relié sans ouvrir la salle.
+    def _pockets(fl):
+        for tx, ty in fl.treasures:
+            if (tx, ty) in fl._locked_cells:
+                for px, py in ((tx, ty-3), (tx, ty+3), (tx-3, ty), (tx+3, ty)):
+                    if 0 < px < fl.w-1 and 0 < py < fl.h-1 and not any(
+                            fl.is_floor(px + ddx, py + ddy) for ddx, ddy in ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1))):
+                        yield (tx, ty), (px, py)
+    fc, ((tx, ty), pocket) = next((fl, pk) for fl in (Floor(d) for d in range(3, 60)) for pk in _pockets(fl))
+    fc._set_floor(*pocket)
+    fc.down = pocket
+    fc._dist_fields.clear()
+    assert fc._ensure_connected() >= 1 and fc.gen_stats['repairs'] >= 1, 'POI emmuré non détecté'
+    assert _bfs_path_exists(fc.grid, fc.start, fc.down) and fc._ensure_connected() == 0, 'Réparation de connexité incomplète'
+    assert all(fc._occ.has(x, y) == fc.is_floor(x, y) for y in range(fc.h) for x in range(fc.w)), 'Occupancy désynchronisée après réparation'
+    ring = [(tx + ddx, ty + ddy) for ddy in range(-2, 3) for ddx in range(-2, 3) if max(abs(ddx), abs(ddy)) == 2]
+    assert all(p in fc._locked_cells for p in ring), 'Murs de salle verrouillée creusables par les réparations'
+    assert not any(fc.is_floor(*p) for p in ring), 'Tunnel de réparation ouvert dans une salle verrouillée'
     # Fog visible
     vis=_visible_cells(f, f.start, radius=5)
     assert f.start in vis, 'La case joueur doit être visible'
+    # Vision en losange incrémentale: identique à la reconstruction complète, pas à pas (bords compris)
+    saved_los, FOV_LINE_OF_SIGHT = FOV_LINE_OF_SIGHT, False
+    try:
+        fv = Floor(2)
+        rng_fov = random.Random(7)
+        pos, seen = (2, 2), set()
+        for i in range(300):
+            radius = 8 if i < 200 else 10
+            if i == 120:
+                pos = (fv.w - 3, fv.h - 3)  # téléportation
+            else:
+                dx, dy = rng_fov.choice(((1, 0), (-1, 0), (0, 1), (0, -1)))
+                pos = (min(fv.w - 1, max(0, pos[0] + dx)), min(fv.h - 1, max(0, pos[1] + dy)))
+            before = set(fv.visible)
+            new = update_fov(fv, pos, radius)
+            full = _visible_cells(fv, pos, radius)
+            seen |= full
+            assert fv.visible == full and new >= full - before and fv.discovered == seen, 'FOV incrémental divergent'
+    finally:
+        FOV_LINE_OF_SIGHT = saved_los
+    # Ombre portée: losange entier en terrain ouvert, arrêtée par les murs, symétrique, en cache
+    W, H = 30, 12
+    open_tiles = bytearray(TILE_FLOOR if 0 < x < W-1 and 0 < y < H-1 else TILE_WALL for y in range(H) for x in range(W))
+    diamond = {(5 + dx) + (5 + dy) * W for dx, dy in fov_offsets(8) if 0 < 5 + dx < W-1 and 0 < 5 + dy < H-1}
+    assert shadowcast(open_tiles, W, H, (5, 5), 8) == diamond, 'Ombre portée: terrain ouvert != losange'
+    for yy in range(1, H-1):
+        open_tiles[yy * W + 9] = TILE_WALL
+    behind = shadowcast(open_tiles, W, H, (5, 5), 8)
+    assert 5 * W + 9 in behind and 5 * W + 10 not in behind, 'Ombre portée: le mur ne bloque pas la vue'
+    fs = Floor(4)
+    floor_cells = [(x, y) for y in range(fs.h) for x in range(fs.w) if fs.is_floor(x, y)]
+    for a in random.Random(4).sample(floor_cells, 12):
+        for k in fs.line_of_sight(a, 8):
+            b = (k % fs.w, k // fs.w)
+            if fs.is_floor(*b):
+                assert a[1] * fs.w + a[0] in fs.line_of_sight(b, 8), 'Ombre portée non symétrique'
+    los = fs.line_of_sight(fs.start, 8)
+    assert fs.line_of_sight(fs.start, 8) is los, 'Champ de vision non mis en cache'
+    for dp in list(fs.locked_doors):
+        fs.unlock_door(dp)
+    assert fs.line_of_sight(fs.start, 8) is not los, 'Cache de vision non invalidé après ouverture de porte'
+    assert len(fov_offsets(8)) == 145 and len(fov_edges(8, (1, 0))[0]) == 17, 'Table de losange incorrecte'
+    # Brouillard en bitset: API d'ensemble, union par OU, sérialisable en octets
+    cb = CellBits(10, 4)
+    cb |= {(0, 0), (9, 3), (4, 2)}
+    other = CellBits(10, 4)
+    other.add((4, 2)); other.add((5, 1))
+    cb |= other
+    cb.discard((0, 0)); cb.discard((-1, 7))
+    assert set(cb) == {(9, 3), (4, 2), (5, 1)} and len(cb) == 3 and (9, 3) in cb and (10, 0) not in cb, 'CellBits incorrect'
+    assert len(bytes(cb)) == 5 and CellBits(10, 4, bytes(cb)) == cb, 'CellBits non sérialisable'
+    try:
+        hash(cb)
+        assert False, 'CellBits est mutable: pas de hash attendu'
+    except TypeError:
+        pass
     # Résumé stats
     p=Player('Test'); s=_ansi_re.sub('', p.stats_summary())
     assert 'HP:' in s and 'ATK:' in s and 'DEF:' in s and 'CRIT:' in s, 'stats_summary format invalide'
@@ -5202,11 +6831,453 @@ def run_tests():
     assert hi_def >= low_def, 'Buff DEF magique doit augmenter avec la POUV'
     assert float(hi_focus.get('spell_crit', 0.0)) >= float(low_focus.get('spell_crit', 0.0)), 'Buff CRIT magique doit augmenter avec la POUV'
     assert float(hi_focus.get('spell_power', 0.0)) >= float(low_focus.get('spell_power', 0.0)), 'Buff puissance magique doit augmenter avec la POUV'
+    # Lecture clavier: automate sur flux tamponné (comptes, sorts rapides, séquences ESC)
+    with TerminalSession(io.StringIO("5d\x1b[A\x1b[6~n12q&e\x1bOr.3")) as ts:
+        assert read_command((0,0), ts) == ('move', (5, (1,0))), 'Nombre + direction invalide'
+        assert read_command((0,0), ts) == ('move', (1, (0,-1))), 'Flèche haut invalide'
+        assert read_command((0,0), ts) == ('quick_spell', 3), 'PgDn doit lancer le sort 3'
+        assert read_command((0,0), ts) == ('move', (12, (-1,0))), 'Préfixe de nombre invalide'
+        assert read_command((0,0), ts) == ('quick_spell', 1)
+        assert read_command((0,0), ts) == ('action', 'e')
+        assert read_command((1,0), ts) == ('move', (2, (1,0))), 'Pavé applicatif + répétition invalide'
+        assert read_command((0,0), ts) == ('quick_spell', 3), 'Chiffre seul en fin de flux = sort rapide'
+    if os.name != 'nt':
+        with TerminalSession(io.StringIO("àd")) as ts:
+            assert read_command((0,0), ts) == ('quick_spell', 10), "'à' doit lancer le sort 10 hors Windows"
+            assert read_command((0,0), ts) == ('move', (1, (1,0))), "'à' ne doit pas avaler la touche suivante"
+    # Avec le préfixe de nombre, un chiffre seul ne déclenche aucune attente
+    ts = TerminalSession(io.StringIO("4"))
+    waits = []
+    ts.read_key = lambda timeout=None, _read=ts.read_key: (waits.append(timeout), _read(timeout))[1]
+    with ts:
+        assert read_command((0,0), ts) == ('quick_spell', 4) and not any(waits[1:]), 'Chiffre seul: attente inutile'
+    with TerminalSession(io.StringIO("d3qe5")) as ts:
+        assert poll_queued_move((0,0), ts) == ('move', (1, (1,0)))
+        assert poll_queued_move((0,0), ts) == ('move', (3, (-1,0))), 'Type-ahead: compte + direction attendu'
+        assert poll_queued_move((0,0), ts) is None, 'Type-ahead: seuls les déplacements sont coalescés'
+        assert read_command((0,0), ts) == ('action', 'e'), 'Type-ahead: la file doit rester intacte'
+        assert poll_queued_move((0,0), ts) is None and read_command((0,0), ts) == ('quick_spell', 5)
+    # Écran à différences: un pas ne réémet que les cellules touchées
+    assert ansi_to_cells(c('#', Ansi.BRIGHT_BLACK) + 'a') == [('#', '90'), ('a', '')], 'Découpage ANSI en cellules incorrect'
+    scr = ScreenBuffer()
+    rows_a = [''.join(c('@' if (x, y) == (5, 5) else '·', Ansi.DIM) for x in range(MAP_W)) for y in range(MAP_H)]
+    rows_b = [''.join(c('@' if (x, y) == (6, 5) else '·', Ansi.DIM) for x in range(MAP_W)) for y in range(MAP_H)]
+    full = scr.diff(rows_a, cols=200)
+    step = scr.diff(rows_b, cols=200)
+    assert scr.last_cells == 2 and '\x1b[6;6H' in step, 'Diff écran doit viser les 2 cellules modifiées'
+    assert len(step) * 10 < len(full), 'Un pas doit coûter un ordre de grandeur de moins qu une frame complète'
+    assert scr.diff(rows_b, cols=200) == f"\x1b[{MAP_H + 1};1H\x1b[J", 'Frame identique: rien à réémettre'
+    # Frames: imbrication = un seul write, stats par frame
+    fbuf = io.StringIO()
+    saved_stream, frames_before = FRAME.stream, FRAME.frames
+    FRAME.stream = fbuf
+    try:
+        with FRAME:
+            emit('début')
+            draw_box('Test', ['ligne'])
+            assert fbuf.getvalue() == '', 'La frame ne doit partir qu à la fermeture du cadre externe'
+    finally:
+        FRAME.stream = saved_stream
+    assert FRAME.frames == frames_before + 1 and fbuf.getvalue().count('\n') == 6, 'Frame imbriquée mal assemblée'
+    assert FRAME.stats()['last_bytes'] == len(fbuf.getvalue().encode('utf-8')), 'Compteur d octets de frame incorrect'
+    # Atlas de glyphes: partagé par thème, reconstruit si le mode couleur change
+    atl = glyph_atlas(THEMES[0])
+    assert glyph_atlas(THEMES[0]) is atl and atl['wall'] == c(WALL, THEMES[0]['wall']), 'Atlas de glyphes non réutilisé'
+    saved_ansi = SUPPORTS_ANSI
+    try:
+        SUPPORTS_ANSI = False
+        assert glyph_atlas(THEMES[0])['wall'] == WALL, 'Atlas sans ANSI doit donner des glyphes bruts'
+    finally:
+        SUPPORTS_ANSI = saved_ansi
+    # Calque des POIs: une lecture par case, tenu à jour au retrait
+    fo = Floor(5)
+    assert POI_KINDS[fo.overlay[fo.down[1] * fo.w + fo.down[0]]] == 'down', 'Calque POI: escalier absent'
+    assert isinstance(fo.overlay, bytearray) and len(fo.overlay) == fo.w * fo.h, 'Calque POI: un octet par case attendu'
+    # Registre des POIs: type + état en une lecture, découverte par les cases nouvellement visibles
+    fp = next(fl for fl in (Floor(d) for d in range(1, 40)) if fl.npcs)
+    npos = next(iter(fp.npcs))
+    assert fp.poi(npos) == Poi('npc', fp.npcs[npos], False) and fp.poi((-1, 0)) is None, 'Registre POI incorrect'
+    assert interaction_hint(fp, fp.down) == POI_HINTS['down'] and interaction_hint(fp, npos) == POI_HINTS['npc'], 'Indice POI incorrect'
+    fp.mark_seen(update_fov(fp, fp.down, 8))
+    assert fp.poi(fp.down).seen and fp.poi(npos).seen == (npos in fp.visible), 'POI visible non marqué vu'
+    fp.mark_seen(update_fov(fp, npos, 8))
+    assert fp.poi(npos).seen and fp.poi(fp.down).seen, 'POI vu oublié hors champ'
+    # Frontière d'exploration: tenue à jour par les cases découvertes, comme un recalcul complet
+    fx = Floor(4)
+    xpos = fx.start
+    front = Frontier(fx)
+    front.update(update_fov(fx, xpos, 8))
+    for _ in range(500):
+        path = front.path_from(xpos)
+        if not path:
+            break
+        assert all(abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1 for a, b in zip([xpos] + path, path)), 'Chemin d exploration non contigu'
+        for xpos in path:
+            front.update(update_fov(fx, xpos, 8))
+        assert front.cells == Frontier(fx).cells, 'Frontière incrémentale différente du recalcul'
+    reach = fx.distance_field(fx.start)
+    assert not front.cells and all((k % fx.w, k // fx.w) in fx.discovered for k, d in enumerate(reach) if d >= 0), 'Exploration auto incomplète'
+    # Aller à: POIs vus seulement, triés par distance de marche, champ de distance en cache par cible
+    fx.seen = CellBits(fx.w, fx.h)
+    fx.mark_seen([fx.down, *fx.shops, *fx.monsters])
+    fx._dist_fields.clear()
+    spots = travel_targets(fx, fx.start)
+    assert not fx._dist_fields, 'Menu de voyage: champ de la position du joueur mis en cache'
+    assert {p for _, _, p in spots} == {fx.down, *fx.shops}, 'Destinations de voyage incorrectes'
+    assert [d for d, _, _ in spots] == sorted(reach[p[1] * fx.w + p[0]] for _, _, p in spots), 'Distances de voyage incorrectes'
+    field_down = fx.distance_field(fx.down)
+    for k in [k for k, d in enumerate(reach) if d >= 0][:Floor.DIST_FIELDS_MAX + 2]:
+        p = (k % fx.w, k // fx.w)
+        travel_targets(fx, p)
+        _pick_teleport_destination(fx, p)
+    assert fx.distance_field(fx.down) is field_down, 'Champ de voyage évincé par les positions du joueur'
+    # Détour: un élite en travers du plus court chemin est contourné par BFS
+    def _open(fl, p):
+        return all(fl.is_floor(p[0] + ddx, p[1] + ddy) for ddx in (-1, 0, 1) for ddy in (-1, 0, 1))
+    fr, blocker = next((fl, p) for fl in (Floor(d) for d in range(1, 40))
+                       for p in _route(fl, fl.start, fl.down)[:-1] if _open(fl, p))
+    straight = _route(fr, fr.start, fr.down)
+    around = _route(fr, fr.start, fr.down, avoid={blocker})
+    assert around[-1] == fr.down and blocker not in around and len(around) <= len(straight) + 2, 'Détour autour d un élite incorrect'
+    assert all(abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1 for a, b in zip([fr.start] + around, around)), 'Détour non contigu'
+    for tp in list(fo.treasures):
+        fo.open_treasure(tp)
+        assert fo.overlay[tp[1] * fo.w + tp[0]] == 0, 'Calque POI: trésor ouvert encore affiché'
+    for dp in list(fo.locked_doors):
+        fo.unlock_door(dp)
+        assert fo.overlay[dp[1] * fo.w + dp[0]] == 0 and fo.grid[dp[1]][dp[0]] == FLOOR, 'Calque POI: porte non ouverte'
+    # Texte en segments: largeur sans regex, wrap identique à wrap_ansi
+    stx = StyledText.from_ansi(c('abc', Ansi.RED) + ' de')
+    assert stx.width == 6 and str(stx) == c('abc', Ansi.RED) + ' de', 'StyledText: aller-retour ANSI incorrect'
+    long_txt = c('mot ' * 12, Ansi.BLUE) + 'fin'
+    assert [visible_len(x) for x in StyledText.from_ansi(long_txt).wrap(10)] == [visible_len(x) for x in wrap_ansi(long_txt, 10)], 'StyledText.wrap diverge de wrap_ansi'
+    assert (StyledText.of('x', Ansi.RED) + 'yz').pad(5).width == 5, 'StyledText: concaténation/padding incorrects'
+    # Cache LRU des libellés d'objets: identité + mode, vidé au changement de mode couleur
+    it_cache = COMMON_ITEMS[0]
+    txt_cache = item_summary(it_cache)
+    hits_before = ITEM_TEXT_CACHE.hits
+    assert item_summary(it_cache) is txt_cache and ITEM_TEXT_CACHE.hits == hits_before + 1, 'Libellé objet non mis en cache'
+    assert isinstance(txt_cache, StyledText), 'Libellé objet: StyledText attendu en cache'
+    assert str(item_summary(it_cache._replace())) == str(txt_cache), 'Copie d objet: même libellé attendu'
+    saved_ansi = SUPPORTS_ANSI
+    try:
+        SUPPORTS_ANSI = False
+        assert '\x1b' not in str(item_summary(it_cache)), 'Cache objet non invalidé au changement de mode couleur'
+    finally:
+        SUPPORTS_ANSI = saved_ansi
+    # Sprites teintés + panneau latéral: réutilisés tant que (sprite, lignes rouges) ne bougent pas
+    ptint = Player('Tint')
+    side_a = _side_panel(ptint)
+    assert _side_panel(ptint)[0] is side_a[0], 'Panneau latéral recalculé sans changement'
+    ptint.hp = max(1, ptint.max_hp // 3)
+    side_b = _side_panel(ptint)
+    assert side_b[0] is not side_a[0] and side_b[1] == side_a[1], 'Panneau latéral non invalidé après perte de PV'
+    assert colorize_sprite_by_hp(SPRITES['knight'], 1, 10) == colorize_sprite_by_hp(SPRITES['knight'], 1, 10), 'Teinte PV instable'
+    # Index des cases libres: placements distincts sur du sol, erreur explicite si plein
+    ffc = Floor(12)
+    placed = [ffc.start, ffc.down, *ffc.npcs, *ffc.shops, *ffc.monsters, *ffc.items, *ffc.altars, *ffc.casinos, *ffc.elites]
+    assert len(placed) == len(set(placed)) and all(ffc.grid[y][x] == FLOOR for x, y in placed), 'Placements d étage en collision'
+    assert not hasattr(ffc, '_free') and not ffc._dist_fields, 'Index de génération gardé sur l étage construit'
+    fc = FreeCells([(1, 1), (2, 1)])
+    fc.discard((1, 1)); fc.discard((2, 1))
+    try:
+        fc.pick()
+        assert False, 'Étage plein: FloorFullError attendue'
+    except FloorFullError:
+        pass
+    # Champ de distance de marche: en cache par référence, vidé à l'ouverture d'une porte
+    fd = Floor(6)
+    fld = fd.distance_field(fd.start)
+    assert fld[fd.start[1] * fd.w + fd.start[0]] == 0 and fd.distance_field(fd.start) is fld, 'Champ de distance non mis en cache'
+    dx, dy = fd.down
+    assert fld[dy * fd.w + dx] > 0, 'Escalier descendant injoignable à pied'
+    for dp in list(fd.locked_doors):
+        fd.unlock_door(dp)
+    assert fd.distance_field(fd.start) is not fld, 'Champ de distance non invalidé après ouverture de porte'
+    # Tuiles compactes: la vue grid reste lisible/écrivable comme avant
+    ft = Floor(2)
+    assert ft.tiles[ft.start[1] * ft.w + ft.start[0]] == TILE_FLOOR and len(ft.grid) == ft.h and len(ft.grid[0]) == ft.w, 'Vue grid incohérente'
+    ft.grid[1][1] = FLOOR
+    assert ft.is_floor(1, 1) and not ft.is_floor(-1, 0) and ''.join(ft.grid[0]) == WALL * ft.w, 'Écriture via la vue grid incorrecte'
+    assert not hasattr(ft, '__dict__'), 'Floor doit utiliser __slots__'
+    # Occupation en masques de bits: rectangles vides et portes des salles verrouillées
+    occ = Occupancy(6)
+    occ.add_span(2, 3, 1); occ.add(7, 4)
+    assert occ.empty(0, 2, 7, 2) and not occ.empty(4, 0, 2, 2) and not occ.empty(7, 4, 1, 1), 'Occupancy.empty incorrect'
+    assert occ.span(0, 8, 1) == [2, 3, 4] and occ.span(5, 3, 4) == [7], 'Occupancy.span incorrect'
+    for d in range(0, 12, 5):
+        fl = Floor(d)
+        assert all(fl._occ.has(x, y) == fl.is_floor(x, y) for y in range(fl.h) for x in range(fl.w)), 'Occupancy désynchronisée des tuiles'
+        for dx, dy in fl.locked_doors:
+            around = [fl.is_floor(dx + 1, dy), fl.is_floor(dx - 1, dy), fl.is_floor(dx, dy + 1), fl.is_floor(dx, dy - 1)]
+            assert not fl.is_floor(dx, dy) and sum(around) == 2, 'Porte verrouillée mal placée'
+    # Étages de taille variable: fenêtre caméra centrée sur le joueur et bornée à l'étage
+    assert floor_size(0) == (MAP_W, MAP_H) and floor_size(10**6) == (MAP_MAX_W, MAP_MAX_H), 'Taille d étage hors bornes'
+    fw = Floor(12, size=(150, 60))
+    assert len(fw.tiles) == 150 * 60 and _bfs_path_exists(fw.grid, fw.start, fw.down), 'Grand étage incohérent'
+    assert map_viewport(fw, (0, 0), term=(80, 30)) == (0, 0, 78, 22), 'Caméra non bornée en haut à gauche'
+    assert map_viewport(fw, (75, 30), term=(80, 30)) == (36, 19, 78, 22), 'Caméra non centrée sur le joueur'
+    assert map_viewport(fw, (149, 59), term=(80, 30)) == (72, 38, 78, 22), 'Caméra non bornée en bas à droite'
+    assert map_viewport(ft, ft.start, term=(300, 100)) == (0, 0, MAP_W, MAP_H), 'Petit étage: carte entière attendue'
+    # HUD enroulé sur un terminal étroit: la frame laisse une ligne libre pour un message (pas de défilement)
+    real_size, saved_stdout, saved_fs = shutil.get_terminal_size, sys.stdout, SHOW_FRAME_STATS
+    try:
+        shutil.get_terminal_size = lambda fallback=(200, 50): os.terminal_size((100, 40))
+        sys.stdout = io.StringIO()
+        hero_vp = Player('Camera')
+        for SHOW_FRAME_STATS in (False, True):
+            MAP_SCREEN.invalidate()
+            render_map(fw, fw.down, hero_vp)
+            assert 30 <= len(MAP_SCREEN.rows) <= 39, 'Frame plus haute que le terminal (HUD enroulé non compté)'
+    finally:
+        shutil.get_terminal_size, sys.stdout, SHOW_FRAME_STATS = real_size, saved_stdout, saved_fs
+    fw.discovered |= {(149, 59), (1, 1)}
+    fwr = Floor.from_delta(fw.to_delta())
+    assert (fwr.w, fwr.h) == (150, 60) and fwr.tiles == fw.tiles and fwr.discovered == fw.discovered, 'Delta: taille d étage perdue'
+    # Pré-génération en arrière-plan: même étage que la génération directe (graine par étage)
+    pf = FloorPrefetcher(424242)
+    try:
+        pf.request([1, 2])
+        deadline = time.time() + 5.0
+        while len(pf._ready) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        random.random()  # tirages du jeu entre-temps: sans effet sur les étages
+        fp2 = pf.take(2)
+        fp3 = pf.take(3)
+    finally:
+        pf.close()
+    ref2 = Floor(2, seed=floor_seed(424242, 2))
+    assert pf.hits == 1 and pf.misses == 1, 'Étage pré-généré non remis au jeu'
+    assert fp2.tiles == ref2.tiles and fp2.monsters == ref2.monsters and fp2.down == ref2.down, 'Étage pré-généré différent de la génération directe'
+    assert fp3.tiles == Floor(3, seed=floor_seed(424242, 3)).tiles, 'Génération à la demande non déterministe'
+    # Génération en échec dans le thread: exception remise à take(), sans attente infinie
+    def _broken_floor(depth, seed=None, size=None):
+        raise FloorFullError("Étage plein: aucune case de sol libre.")
+    real_floor = Floor
+    pf = FloorPrefetcher(31337)
+    try:
+        globals()['Floor'] = _broken_floor
+        pf.request([1])
+        deadline = time.time() + 5.0
+        while 1 not in pf._failed and time.time() < deadline:
+            time.sleep(0.01)
+        globals()['Floor'] = real_floor
+        try:
+            pf.take(1)
+            assert False, 'Échec de pré-génération non remonté'
+        except FloorFullError:
+            pass
+        assert pf.take(1).tiles == Floor(1, seed=floor_seed(31337, 1)).tiles, 'Étage non régénéré après un échec'
+    finally:
+        globals()['Floor'] = real_floor
+        pf.close()
+    # Étages matérialisés à l'entrée seulement; un étage sauté reste générable plus tard
+    pf = FloorPrefetcher(777)
+    try:
+        store = FloorStore(pf)
+        store[0]; store[3]
+        st = store.stats()
+        assert 1 not in store and (st['deepest'], st['generated'], st['avoided']) == (3, 2, 2), 'Étages sautés générés inutilement'
+        assert store[2].tiles == Floor(2, seed=floor_seed(777, 2)).tiles and store.stats()['avoided'] == 1, 'Remontée: étage sauté mal matérialisé'
+    finally:
+        pf.close()
+    # Sauts de +3 avec pré-génération comme en jeu: seul depth+1 part en fond, tout est compté
+    pf = FloorPrefetcher(778)
+    try:
+        store = FloorStore(pf)
+        for d in (0, 3, 6):
+            store[d]
+            store.prefetch_after(d)
+        deadline = time.time() + 5.0
+        while (pf._pending or pf._busy is not None) and time.time() < deadline:
+            time.sleep(0.01)
+        st = store.stats()
+        assert st['generated'] == pf.misses + pf.hits + st['discarded'] + len(pf._ready), 'Constructions de fond non comptées'
+        assert pf.built_depths <= {0, 1, 3, 4, 6, 7}, 'Étages sautés pré-générés'
+        assert st['avoided'] == sum(d not in pf.built_depths for d in range(7)) >= 2, 'Étages évités mal comptés'
+    finally:
+        pf.close()
+    # Éviction LRU: un étage froid revient identique (graine + delta)
+    pf = FloorPrefetcher(99)
+    try:
+        store = FloorStore(pf, max_hot=2)
+        fe = store[5]
+        fe.remove_monster(next(iter(fe.monsters)))
+        for tp in list(fe.treasures): fe.open_treasure(tp)
+        for dp in list(fe.locked_doors): fe.unlock_door(dp)
+        fe.discovered |= {fe.start, fe.down}
+        fe.seen.add(fe.down)
+        snap = (bytes(fe.tiles), set(fe.monsters), set(fe.treasures), set(fe.discovered), set(fe.seen), bytes(fe.overlay))
+        store[6]; store[7]
+        assert store.stats()['cold'] == 1 and 5 in store, 'Étage froid non réduit à un delta'
+        fr = store[5]
+        assert fr is not fe and (bytes(fr.tiles), fr.monsters, fr.treasures, fr.discovered, fr.seen, fr.overlay) == snap, 'Étage restauré différent'
+        assert store.stats()['restored'] == 1 and store.stats()['hot'] == 2, 'LRU des étages non respecté'
+        # Le delta vient des retraits notés en jeu: aucun étage vierge reconstruit à l'éviction
+        real_floor, built = Floor, []
+        try:
+            globals()['Floor'] = lambda *a, **k: built.append(a) or real_floor(*a, **k)
+            d5 = fr.to_delta()
+        finally:
+            globals()['Floor'] = real_floor
+        assert not built and d5 == fe.to_delta() and d5.removed_monsters and d5.opened_treasures, 'Delta d éviction incorrect'
+    finally:
+        pf.close()
+    print('OK')
+
+# ========================== BENCHMARKS ==========================
+def _bench(label, fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    ms = (time.perf_counter() - t0) * 1000.0 / n
+    print(f"  {label:<52} {ms:9.3f} ms")
+    return ms
+
+def _deep_sizeof(obj, seen=None):
+    # Taille mémoire approximative (sys.getsizeof récursif sur conteneurs et slots).
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, (str, int, float, bool, type(None))):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(_deep_sizeof(v, seen) for v in obj)
+    elif hasattr(obj, '__slots__') and not isinstance(obj, (bytes, bytearray)):
+        for name in obj.__slots__:
+            if hasattr(obj, name):
+                size += _deep_sizeof(getattr(obj, name), seen)
+    return size
+
+def run_benchmarks():
+    """Mesures de perf reproductibles: python rpg_roguelike_terminal.py --bench"""
+    global FOV_LINE_OF_SIGHT
+    print('Benchmarks (moyenne par appel):')
+    random.seed(1234)
+    depths = iter(range(10**9))
+    _bench(f'génération Floor {MAP_W}x{MAP_H} (profondeurs 0..39)', lambda: Floor(next(depths) % 40, size=(MAP_W, MAP_H)), 200)
+    fb = Floor(10, size=(MAP_W, MAP_H))
+    _bench('distance_field (BFS, sans cache)', lambda: (fb._dist_fields.clear(), fb.distance_field(fb.start)), 200)
+    print('Mémoire par étage:')
+    as_lists = [[TILE_CHARS[t] for t in fb.tiles[y*fb.w:(y+1)*fb.w]] for y in range(fb.h)]
+    print(f"  {'grille en liste de listes (ancien format)':<52} {_deep_sizeof(as_lists):9d} o")
+    print(f"  {'tuiles bytearray':<52} {sys.getsizeof(fb.tiles):9d} o")
+    cells = {(x, y) for y in range(fb.h) for x in range(fb.w)}
+    fog = CellBits(fb.w, fb.h)
+    fog |= cells
+    print(f"  {'brouillard en set de tuples (étage découvert)':<52} {_deep_sizeof(cells):9d} o")
+    print(f"  {'brouillard en bitset (étage découvert)':<52} {_deep_sizeof(fog):9d} o")
+    fb._dist_fields.clear()
+    print(f"  {'Floor complet (hors thème partagé et caches)':<52} {_deep_sizeof(fb, {id(fb.theme)}):9d} o")
+    print(f'Champ de vision par déplacement (marche aléatoire de 400 pas sur le sol, {MAP_W}x{MAP_H}):')
+    fv = Floor(3, size=(MAP_W, MAP_H))
+    walk, pos, rng_walk = [], fv.start, random.Random(3)
+    while len(walk) < 400:
+        dx, dy = rng_walk.choice(((1, 0), (-1, 0), (0, 1), (0, -1)))
+        if fv.is_floor(pos[0] + dx, pos[1] + dy):
+            pos = (pos[0] + dx, pos[1] + dy)
+            walk.append(pos)
+    saved_los = FOV_LINE_OF_SIGHT
+    try:
+        for r in (8, 11):
+            k = iter(range(10**9))
+            _bench(f'losange reconstruit + discovered |= (rayon {r})',
+                   lambda: fv.discovered.__ior__(_visible_cells(fv, walk[next(k) % len(walk)], r)), 2000)
+            FOV_LINE_OF_SIGHT = False
+            _bench(f'update_fov losange incrémental (rayon {r})', lambda: update_fov(fv, walk[next(k) % len(walk)], r), 2000)
+            _bench(f'shadowcast sans cache (rayon {r})', lambda: shadowcast(fv.tiles, fv.w, fv.h, walk[next(k) % len(walk)], r), 2000)
+            FOV_LINE_OF_SIGHT = True
+            _bench(f'update_fov ombre portée + cache (rayon {r})', lambda: update_fov(fv, walk[next(k) % len(walk)], r), 2000)
+    finally:
+        FOV_LINE_OF_SIGHT = saved_los
+    print("Exploration auto sans rencontres (frontière + vision par pas, jusqu'à étage exploré):")
+    for w, h in ((MAP_W, MAP_H), (200, 80)):
+        for incremental in (True, False):
+            fa = Floor(6, size=(w, h))
+            apos, path, steps = fa.start, [], 0
+            t0 = time.perf_counter()
+            front = Frontier(fa)
+            front.update(update_fov(fa, apos, 8))
+            while True:
+                if not path or path[-1] not in front.cells:
+                    path = front.path_from(apos)
+                    if not path:
+                        break
+                apos = path.pop(0)
+                new = update_fov(fa, apos, 8)
+                if incremental:
+                    front.update(new)
+                else:
+                    front = Frontier(fa)
+                steps += 1
+            ms = (time.perf_counter() - t0) * 1000.0
+            label = f"{w}x{h}, frontière {'incrémentale' if incremental else 'recalculée à chaque pas'}"
+            print(f"  {label:<52} {ms / steps:9.3f} ms/pas ({steps} pas)")
+    print("Taille d'étage (génération, BFS, rendu de la fenêtre caméra, carte entièrement découverte):")
+    hero = Player('Bench')
+    saved_stdout = sys.stdout
+    for w, h in ((MAP_W, MAP_H), (200, 80), (500, 200)):
+        n = max(3, 40 * MAP_W * MAP_H // (w * h))
+        gen = _bench(f'génération {w}x{h}', lambda: Floor(12, size=(w, h)), n)
+        fs = Floor(12, size=(w, h))
+        _bench(f'distance_field {w}x{h}', lambda: (fs._dist_fields.clear(), fs.distance_field(fs.start)), n)
+        fs.discovered |= {(x, y) for y in range(h) for x in range(w)}
+        spots = iter(range(10**9))
+        sys.stdout = io.StringIO()
+        try:
+            ms = _bench(f'render_map {w}x{h}', lambda: render_map(fs, (fs.start, fs.down)[next(spots) % 2], hero), 20)
+        finally:
+            sys.stdout = saved_stdout
+        _, _, vw, vh = map_viewport(fs, fs.start, side_w=_side_panel(hero)[1] + 2)
+        label = f'render_map {w}x{h} (fenêtre {vw}x{vh})'
+        print(f"  {label:<52} {ms:9.3f} ms")
+        print(f"  {'génération par case':<52} {gen * 1e6 / (w * h):9.0f} ns")
+    print('Descente "Suicidaire" (+3) jusqu\'à l\'étage 99, pré-génération comprise:')
+    pf = FloorPrefetcher(1234)
+    try:
+        store = FloorStore(pf)
+        t0 = time.perf_counter()
+        for d in range(0, 100, 3):
+            store[d]
+            store.prefetch_after(d)
+        ms = (time.perf_counter() - t0) * 1000.0
+        st = store.stats()
+        print(f"  {'étages générés (dont lâchés) / évités':<52} {st['generated']:>4} ({st['discarded']}) / {st['avoided']:<4} ({ms:.1f} ms)")
+        print(f"  {'tirages rejetés / POIs isolés / couloirs de réparation':<52} {st['retries']:>4} / {st['unreachable']} / {st['repairs']}")
+    finally:
+        pf.close()
+    print(f'Descente "Prudent" sur 120 étages (LRU {FLOOR_LRU_SIZE}):')
+    pf = FloorPrefetcher(1234)
+    try:
+        store = FloorStore(pf)
+        for d in range(120):
+            fl = store[d]
+            fl.discovered |= _visible_cells(fl, fl.start)
+            fl.remove_monster(next(iter(fl.monsters), None))
+        st = store.stats()
+        hot_b, cold_b = _deep_sizeof(store._hot), _deep_sizeof(store._cold)
+        rows = [
+            (f"{st['hot']} étages entiers", hot_b),
+            (f"{st['cold']} deltas (moy. {cold_b // max(1, st['cold'])} o)", cold_b),
+            ("total borné", hot_b + cold_b),
+            ("sans éviction (120 étages entiers, estimation)", hot_b * 120 // max(1, st['hot'])),
+        ]
+        for label, size in rows:
+            print(f"  {label:<52} {size:9d} o")
+        t0 = time.perf_counter()
+        store[0]
+        print(f"  {'retour sur un étage froid (graine + delta)':<52} {(time.perf_counter() - t0) * 1000.0:9.3f} ms")
+        hot = max(store._hot.values(), key=lambda fl: fl.w * fl.h)
+        _bench(f'éviction: to_delta ({hot.w}x{hot.h})', hot.to_delta, 200)
+    finally:
+        pf.close()
     print('OK')
 
 if __name__=='__main__':
     try:
-        if '--test' in sys.argv:
+        if '--test' in sys.argv or '--bench' in sys.argv:
             game_loop()
         else:
             while True: